@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+from openpyxl import load_workbook
+from openpyxl.comments import Comment
+from openpyxl.styles import PatternFill
+from llm_check import CheckResult
+import map_cache
+
+# Collects audit verdicts and writes them out once, instead of saving the workbook after every row like check_range in
+# main.py did. Every checked shape is appended to a small JSONL journal as it arrives (one line per representative, its
+# members by reference), so a crashed run can pick up where it left off without asking the model again. The journal is
+# removed once the run finishes. Output is either the annotated workbook (one load, one save) or a JSON/CSV sidecar report
+# that leaves the workbook untouched.
+
+FILLS = {
+    "Y": PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid"), #Green
+    "outlier": PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid"), #Orange, formula breaks the pattern around it
+    "N": PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"), #Red
+}
+MAX_COMMENT_CHARS = 32767 #Excel's limit, longer comments corrupt the file
+REPORT_FIELDS = ["ws", "cell", "verdict", "outlier", "representative", "error", "reasoning"]
+
+
+def journal_path(workbook_map, cache_dir=map_cache.CACHE_DIR):
+    """
+    Journal file for this exact workbook + map config (map_cache.cache_key), so an edited workbook, a renamed table or a
+    changed check_cell_range never resumes stale verdicts.
+    """
+    return os.path.join(cache_dir, f"annotations-{map_cache.cache_key(workbook_map)[:16]}.jsonl")
+
+
+def _fill_for(shape_verdict):
+    if shape_verdict.result.verdict == "N":
+        return FILLS["N"]
+    if shape_verdict.outlier:
+        return FILLS["outlier"]
+    return FILLS.get(shape_verdict.result.verdict)
+
+
+def _comment_text(coord, shape_verdict):
+    result = shape_verdict.result
+    text = result.reasoning
+    if shape_verdict.representative != coord:
+        text = f"Same formula shape as {shape_verdict.representative}, checked there.\n\n{text}"
+    if shape_verdict.outlier:
+        text = f"PATTERN OUTLIER: this formula differs from its neighbours.\n\n{text}"
+    if result.error:
+        text = f"CHECK FAILED: {result.error}\n\n{text}"
+    return text[:MAX_COMMENT_CHARS]
+
+
+class AnnotationSink:
+    """
+    Buffer of audit verdicts backed by an append-only journal.
+
+    verdicts only ever holds cells of the current audit (recorded, or resumed through audit.prepare_checks), so the report
+    and annotated workbook never list cells from an older plan.
+
+    Args:
+        path (str): JSONL journal. If it already exists (a previous run crashed or was stopped), its results are loaded so the
+        audit can skip those shapes. None keeps everything in memory only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.verdicts = {} #{(ws_title, coord): ShapeVerdict}
+        self.journaled = {} #{(ws_title, representative coord): (CheckResult, set(member coords))} from the journal
+        self._pending = []
+        self._journal = None
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError: #last line cut off by the crash
+                    continue
+                result = CheckResult(entry["verdict"], entry["reasoning"], entry["error"])
+                self.journaled[(entry["ws"], entry["cell"])] = (result, set(entry["members"]))
+
+    def resumable(self, representative, group):
+        """
+        The journaled result for a shape, or None if it has to be checked (again): not journaled, the journal's group doesn't
+        cover all of group, or the check failed (rate limits, outage) and only got an errored "Unknown".
+
+        Args:
+            representative (tuple): (ws_title, coord) the check was run on
+
+            group (list): every (ws_title, coord) sharing its verdict in the current plan
+        """
+        entry = self.journaled.get(representative)
+        if entry is None or entry[0].error or not all(coord in entry[1] for _, coord in group):
+            return None
+        return entry[0]
+
+    def record(self, representative, result, group_verdicts):
+        """
+        Buffer one checked shape: every member's verdict, journaled as a single line. Nothing hits the disk until flush().
+
+        Args:
+            representative (tuple): (ws_title, coord) the check was run on
+
+            result (CheckResult)
+
+            group_verdicts (dict): {(ws_title, coord): ShapeVerdict} for every member of the shape
+        """
+        self.verdicts.update(group_verdicts)
+        ws_title, coord = representative
+        self._pending.append(json.dumps({"ws": ws_title, "cell": coord, "verdict": result.verdict, "reasoning": result.reasoning,
+                                         "error": result.error, "members": [member for _, member in group_verdicts]}))
+
+    def flush(self):
+        """
+        Append everything recorded since the last flush to the journal, as one write.
+        """
+        if not self.path or not self._pending:
+            self._pending = []
+            return
+        if self._journal is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._journal = open(self.path, "a")
+        self._journal.write("\n".join(self._pending) + "\n")
+        self._journal.flush()
+        self._pending = []
+
+    def close(self):
+        """
+        Call once the audit has finished and its report / annotated copy are written: the journal (only there to survive a
+        crash) is removed. A repeat audit of the same workbook is answered by the LLM cache instead.
+        """
+        self._pending = []
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.journaled = {}
+
+    def write_workbook(self, workbook_path, output_path):
+        """
+        Apply every verdict as a comment + fill and save once. Macros are kept for .xlsm.
+
+        Args:
+            workbook_path (str): the audited workbook
+
+            output_path (str): where to save the annotated copy (same extension as workbook_path, or Excel refuses to open it)
+        """
+        workbook = load_workbook(workbook_path, keep_vba=workbook_path.lower().endswith(".xlsm"))
+        for (ws_title, coord), shape_verdict in self.verdicts.items():
+            if ws_title not in workbook.sheetnames:
+                print(f"ANNOTATIONS: sheet '{ws_title}' not in {workbook_path}, skipping {coord}")
+                continue
+            cell = workbook[ws_title][coord]
+            cell.comment = Comment(text=_comment_text(coord, shape_verdict), author="Maestro")
+            fill = _fill_for(shape_verdict)
+            if fill:
+                cell.fill = fill
+        workbook.save(output_path)
+        workbook.close()
+
+    def write_report(self, output_path):
+        """
+        Sidecar report instead of touching the workbook: .csv gets one row per cell, anything else is written as JSON.
+        """
+        rows = []
+        for (ws_title, coord), shape_verdict in sorted(self.verdicts.items()):
+            result = shape_verdict.result
+            rows.append({"ws": ws_title, "cell": coord, "verdict": result.verdict, "outlier": shape_verdict.outlier,
+                         "representative": shape_verdict.representative, "error": result.error, "reasoning": result.reasoning})
+
+        if output_path.lower().endswith(".csv"):
+            with open(output_path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(output_path, "w") as f:
+                json.dump(rows, f, indent=2)
@@ -0,0 +1,202 @@
+from openpyxl.utils import range_boundaries, get_column_letter
+import parse
+import llm_check
+import instrument
+import parallel
+from formula_shapes import group_by_shape, find_outliers, to_r1c1, ShapeVerdict
+
+# Whole-workbook audit: every formula cell in each table's check_cell_range gets the guess-then-evaluate check, but filled
+# formulas are grouped by R1C1 shape (per table) so only one cell per shape actually goes to the model.
+
+GUESS_PROMPT = """
+You are a keen-eyed excel expert who is skilled at catching subtle formula errors or typos.
+
+You are looking at a workbook which has the following purpose: {workbook_purpose}
+
+The cell sits in this table:
+{table_context}
+
+You are currently determining the correct formula for {cell}. {cell} is defined as {row_descrip} (Row {row}) in {col_descrip} (Column {col})
+
+What would you expect {cell}'s formula to be? Answer in 2 sentences.
+"""
+
+
+def _formula_of(cell):
+    """
+    Formula text for a streamed cell (xlsx_stream) or an openpyxl data_only=False cell, None for constants.
+    """
+    if hasattr(cell, "formula"):
+        return cell.formula
+    return cell.value if cell.data_type == 'f' else None
+
+
+def collect_formula_cells(workbook_map, workbook):
+    """
+    Returns:
+        formula_cells (dict): {ws_title: {coord: (formula, table_title, check_cell_range)}} for every formula in a check_cell_range
+    """
+    formula_cells = {}
+    for worksheet in workbook_map["worksheets"]:
+        ws_title = worksheet["ws_title"]
+        ws = workbook[ws_title]
+        sheet_cells = formula_cells.setdefault(ws_title, {})
+        for table in worksheet["tables"]:
+            min_col, min_row, max_col, max_row = range_boundaries(table["check_cell_range"])
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    coord = f"{get_column_letter(col)}{row}"
+                    formula = _formula_of(ws[coord])
+                    if formula:
+                        sheet_cells[coord] = (formula, table["title"], table["check_cell_range"]) #later tables win, same as the semantic map
+    return formula_cells
+
+
+def build_request(ws_title, coord, formula, check_cell_range, cell_lookup, workbook, workbook_purpose, context=None):
+    """
+    Args:
+        workbook: where the formula context's value fallbacks are read from (value_index.ValueProvider, or any workbook)
+
+        context (str): the formula's reference context if it was already built (parallel.formula_contexts_parallel)
+
+    Returns:
+        CheckRequest for one cell: the guess prompt (table + cell headers, no formula) and the formula's reference context for the evaluation turn
+    """
+    try:
+        cell_data = cell_lookup[ws_title][coord]
+    except KeyError:
+        cell_data = {"row_descrip": "NULL", "col_descrip": "NULL", "title": ""}
+    col_letter = coord.rstrip("0123456789")
+    prompt = GUESS_PROMPT.format(
+        workbook_purpose=workbook_purpose,
+        table_context=parse.range_to_context(check_cell_range, ws_title, ws_title, cell_lookup, compact=True),
+        cell=coord,
+        row_descrip=cell_data["row_descrip"],
+        row=coord[len(col_letter):],
+        col_descrip=cell_data["col_descrip"],
+        col=col_letter,
+    )
+    if context is None:
+        context = parse.formula_context(formula, ws_title, cell_lookup, workbook, compact=True)
+    return llm_check.CheckRequest(ws_title, coord, formula, prompt, context)
+
+
+def plan_audit(workbook_map, cell_lookup, workbook, only=None, workers=None, values_wb=None):
+    """
+    Work out which cells actually need a model call. only restricts it to a set of (ws_title, coord), e.g. incremental.affected_cells
+    after an edit (outliers are still judged against the whole sheet). With workers > 1 the formula contexts for the requests
+    are built in a process pool, one task per sheet (parallel.formula_contexts_parallel).
+
+    workbook is only walked sheet by sheet for the formulas. The contexts' value fallbacks jump between sheets, so they're
+    read from values_wb (a value_index.ValueProvider) when given, instead of making a streamed workbook re-parse evicted sheets.
+
+    Returns:
+        (requests, members, outliers):
+            requests is one CheckRequest per (sheet, table, shape) group,
+            members[i] is every (ws_title, coord) that shares requests[i]'s verdict,
+            outliers is the set of (ws_title, coord) that break the fill pattern around them
+    """
+    workbook_purpose = workbook_map.get("wb_purpose", "not given")
+    values_wb = workbook if values_wb is None else values_wb
+    members, outliers = [], set()
+
+    with instrument.stage("collect_formulas"):
+        formula_cells = collect_formula_cells(workbook_map, workbook)
+
+    representatives = {} #{ws_title: {coord: formula}}, one cell per shape group
+    for ws_title, sheet_cells in formula_cells.items():
+        formulas = {coord: formula for coord, (formula, _, _) in sheet_cells.items()}
+        shapes = {coord: to_r1c1(formula, coord) for coord, formula in formulas.items()}
+        outliers.update((ws_title, coord) for coord in find_outliers(formulas, shapes))
+        if only is not None:
+            formulas = {coord: formula for coord, formula in formulas.items() if (ws_title, coord) in only}
+
+        for group in group_by_shape(formulas, partition=lambda coord: sheet_cells[coord][1], shapes=shapes):
+            representatives.setdefault(ws_title, {})[group.cells[0]] = formulas[group.cells[0]]
+            members.append([(ws_title, coord) for coord in group.cells])
+
+    contexts = {}
+    if workers and workers > 1 and representatives:
+        with instrument.stage("prompt_construction"):
+            contexts = parallel.formula_contexts_parallel(workbook_map["wb_title"], cell_lookup, representatives, workers=workers, compact=True)
+
+    requests = []
+    for group in members:
+        ws_title, representative = group[0]
+        formula, _, check_cell_range = formula_cells[ws_title][representative]
+        with instrument.stage("prompt_construction"):
+            requests.append(build_request(ws_title, representative, formula, check_cell_range, cell_lookup, values_wb, workbook_purpose,
+                                          context=contexts.get(ws_title, {}).get(representative)))
+    return requests, members, outliers
+
+
+def audit_workbook(workbook_map, cell_lookup, workbook, client_kwargs=None, only=None, sink=None, workers=None, values_wb=None, **engine_kwargs):
+    """
+    Check every formula in the workbook_map's check ranges, one model conversation per formula shape.
+
+    Args:
+        workbook_map (dict): contents of workbook_map.json
+
+        cell_lookup (dict): {ws_title: SheetIndex} from semantic_map / map_cache
+
+        workbook: workbook with formulas (a StreamedWorkbook, or openpyxl with data_only=False)
+
+        client_kwargs (dict): passed to openai.AsyncOpenAI
+
+        only (set): optional {(ws_title, coord)} to re-check, everything else is left out of the result
+
+        sink (annotations.AnnotationSink): optional. Shapes its journal already holds (from a crashed run) are not re-checked,
+        and each new result is journaled as soon as its check finishes
+
+        workers (int): processes for building the prompts' formula contexts, see plan_audit
+
+        values_wb (value_index.ValueProvider): where the formula contexts' value fallbacks are read from, see plan_audit
+
+        **engine_kwargs: concurrency, tokens_per_minute, max_retries, ... see llm_check.run_checks
+
+    Returns:
+        verdicts (dict): {(ws_title, coord): ShapeVerdict(CheckResult, representative coord, outlier flag)}
+    """
+    requests, members, outliers = plan_audit(workbook_map, cell_lookup, workbook, only=only, workers=workers, values_wb=values_wb)
+    total_cells = sum(len(group) for group in members)
+    print(f"AUDIT: {total_cells} formula cells, {len(requests)} distinct shapes to check, {len(outliers)} pattern outliers")
+
+    requests, verdicts, record = prepare_checks(requests, members, outliers, sink=sink)
+    with instrument.stage("llm_checks"):
+        llm_check.check_cells(requests, client_kwargs=client_kwargs, on_result=record, **engine_kwargs)
+    return verdicts
+
+
+def prepare_checks(requests, members, outliers, sink=None):
+    """
+    Turn plan_audit's output into what llm_check.run_checks needs, dropping the shapes sink already has verdicts for.
+
+    Returns:
+        (requests, verdicts, record):
+            requests still to send,
+            verdicts is {(ws_title, coord): ShapeVerdict}, pre-filled from sink and filled in as checks finish,
+            record is the on_result callback for run_checks (fans each result out to its group, journals it to sink)
+    """
+    verdicts = {}
+    if sink is not None:
+        pending = []
+        for i, (request, group) in enumerate(zip(requests, members)):
+            result = sink.resumable((request.ws, request.cell), group)
+            if result is None:
+                pending.append(i)
+                continue
+            group_verdicts = {key: ShapeVerdict(result, request.cell, key in outliers) for key in group} #outlier flags come from the current plan
+            verdicts.update(group_verdicts)
+            sink.verdicts.update(group_verdicts)
+        requests, members = [requests[i] for i in pending], [members[i] for i in pending]
+        if verdicts:
+            print(f"AUDIT: resuming, {len(verdicts)} cells already checked, {len(requests)} shapes left")
+
+    def record(i, result):
+        group_verdicts = {key: ShapeVerdict(result, requests[i].cell, key in outliers) for key in members[i]}
+        verdicts.update(group_verdicts)
+        if sink is not None:
+            sink.record((requests[i].ws, requests[i].cell), result, group_verdicts)
+            sink.flush()
+
+    return requests, verdicts, record
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import openai
+import annotations
+import audit
+import llm_check
+import map_cache
+import table_detect
+from llm_cache import LLMCache
+from value_index import ValueProvider
+from workbook_session import WorkbookSession
+
+# Audit a whole portfolio of workbooks in one go. The CPU side (semantic map, formula shapes, prompts) for each workbook runs
+# in a process pool, and every workbook's model calls go through one event loop that shares a single concurrency + TPM
+# budget, so the budget is spent on whichever workbooks are ready instead of being split up front.
+#
+#   python batch_audit.py models/                      # every .xlsx/.xlsm in models/, maps from <name>.map.json next to each
+#   python batch_audit.py manifest.json -o results/    # [{"workbook": "a.xlsm", "map": "a_map.json"}, ...]
+#
+# A workbook with no map gets one from table_detect. Workbooks (and maps) whose bytes haven't changed since the last fully
+# successful run are skipped, tracked in <output>/batch_state.json. Each workbook gets <output>/<name>-<path hash>.audit.json (or .csv),
+# plus an annotated copy with --annotate. An interrupted run resumes from the per-workbook journals (annotations.py).
+
+WORKBOOK_PATTERNS = ("*.xlsx", "*.xlsm")
+STATE_FILE = "batch_state.json"
+
+
+def discover(source):
+    """
+    Args:
+        source (str): directory of workbooks, or a JSON manifest listing {"workbook", "map"} entries ("map" optional)
+
+    Returns:
+        jobs (list): {"workbook": path, "map": path or None}
+    """
+    if os.path.isdir(source):
+        jobs = []
+        for pattern in WORKBOOK_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(source, pattern))):
+                name = os.path.basename(path)
+                if name.startswith("~$") or ".annotated." in name: #Excel lock files, our own output
+                    continue
+                map_path = f"{os.path.splitext(path)[0]}.map.json"
+                jobs.append({"workbook": path, "map": map_path if os.path.exists(map_path) else None})
+        return jobs
+
+    with open(source, "r") as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(source))
+    resolve = lambda path: path if path is None or os.path.isabs(path) else os.path.join(base, path) #manifest paths are relative to the manifest
+    return [{"workbook": resolve(entry["workbook"]), "map": resolve(entry.get("map"))} for entry in manifest]
+
+
+def job_key(job):
+    """
+    Content hash of the workbook plus its map file, so a rename or touch doesn't trigger a re-audit but any edit does.
+    """
+    digest = hashlib.sha256(map_cache.workbook_digest(job["workbook"]).encode())
+    if job["map"]:
+        digest.update(map_cache.workbook_digest(job["map"]).encode())
+    return digest.hexdigest()
+
+
+def _plan(job, previous_key):
+    """
+    Process-pool side of one workbook: hash it, and unless it's unchanged, build its audit plan.
+
+    Returns:
+        plan (dict): key, status ("skipped" / "planned"), and for planned workbooks the requests/members/outliers from
+        audit.plan_audit plus the journal path
+    """
+    key = job_key(job)
+    if key == previous_key:
+        return {"key": key, "status": "skipped"}
+
+    if job["map"]:
+        with open(job["map"], "r") as f:
+            workbook_map = json.load(f)
+    else:
+        workbook_map = table_detect.build_workbook_map(job["workbook"])
+    workbook_map["wb_title"] = job["workbook"] #maps are often copied between client files, the workbook we were given wins
+
+    session = WorkbookSession(streaming=True, max_sheets=2) #mapping and collecting formulas go sheet by sheet
+    cell_lookup, _ = map_cache.load_semantic_map(workbook_map, session=session)
+    values_wb = ValueProvider(job["workbook"]) #value fallbacks jump between sheets, read them from the on-disk index
+    try:
+        requests, members, outliers = audit.plan_audit(workbook_map, cell_lookup, session.get_workbook(job["workbook"]), values_wb=values_wb)
+    finally:
+        values_wb.close()
+    return {"key": key, "status": "planned", "requests": requests, "members": members, "outliers": outliers,
+            "journal": annotations.journal_path(workbook_map)}
+
+
+def _annotate(workbook_path, verdicts, output_path):
+    sink = annotations.AnnotationSink()
+    sink.verdicts.update(verdicts)
+    sink.write_workbook(workbook_path, output_path)
+
+
+def _output_name(workbook_path):
+    """
+    clientA/model.xlsm -> "model-<8 hex>": the basename for readability, plus a hash of the full path so same-named workbooks
+    from different folders don't overwrite each other's reports.
+    """
+    path_hash = hashlib.sha256(os.path.abspath(workbook_path).encode()).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(workbook_path))[0]}-{path_hash}"
+
+
+def _save_state(state, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path) #the state file is what decides what gets skipped next time, never leave it half written
+
+
+async def run_batch(jobs, output_dir, workers=None, concurrency=16, tokens_per_minute=None, client_kwargs=None,
+                    cache=None, report_format="json", annotate=False, force=False, **engine_kwargs):
+    """
+    Args:
+        jobs (list): from discover()
+
+        output_dir (str): per-workbook reports, annotated copies and batch_state.json go here
+
+        workers (int): process pool size for planning / annotating, defaults to the number of cores
+
+        concurrency (int), tokens_per_minute (int): one budget shared by every workbook's model calls
+
+        client_kwargs (dict): passed to openai.AsyncOpenAI
+
+        cache (llm_cache.LLMCache): optional response cache
+
+        report_format (str): "json" or "csv"
+
+        annotate (bool): also save <name>.annotated.<ext> with comments + fills
+
+        force (bool): re-audit workbooks even if they haven't changed, ignoring any journal left by a crashed run
+
+        **engine_kwargs: max_retries, backoff, model, ... see llm_check.run_checks
+
+    Returns:
+        summary (dict): {workbook path: {"status", "cells", "flagged", "errored", "seconds", ...}}, status is "audited",
+        "partial" (some checks failed, re-audited next run), "skipped" or "failed"
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILE)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = llm_check.TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+    client = openai.AsyncOpenAI(max_retries=0, **(client_kwargs or {}))
+    summary = {}
+
+    async def run_job(pool, job):
+        path = job["workbook"]
+        start = time.perf_counter()
+        previous_key = None if force else state.get(path, {}).get("key")
+        try:
+            plan = await loop.run_in_executor(pool, _plan, job, previous_key)
+            if plan["status"] == "skipped":
+                summary[path] = {"status": "skipped"}
+                print(f"BATCH: {path} unchanged, skipped")
+                return
+
+            if force and os.path.exists(plan["journal"]):
+                os.remove(plan["journal"]) #a forced re-audit asks the model again instead of resuming a crashed run's verdicts
+            sink = annotations.AnnotationSink(plan["journal"])
+            requests, verdicts, record = audit.prepare_checks(plan["requests"], plan["members"], plan["outliers"], sink=sink)
+            await llm_check.run_checks(requests, client, cache=cache, on_result=record, semaphore=semaphore, limiter=limiter, progress=None, **engine_kwargs)
+
+            name = _output_name(path)
+            report_path = os.path.join(output_dir, f"{name}.audit.{report_format}")
+            sink.write_report(report_path)
+            if annotate:
+                await loop.run_in_executor(pool, _annotate, path, sink.verdicts, os.path.join(output_dir, f"{name}.annotated{os.path.splitext(path)[1]}"))
+            sink.close() #only once the outputs are written, a crash while saving keeps the journal
+        except Exception as e: #one broken client file shouldn't take the rest of the portfolio down with it
+            summary[path] = {"status": "failed", "error": f"{type(e).__name__}: {e}", "seconds": round(time.perf_counter() - start, 3)}
+            print(f"BATCH: {path} failed: {type(e).__name__}: {e}")
+            return
+
+        flagged = sum(1 for verdict in verdicts.values() if verdict.result.verdict != "Y" or verdict.outlier)
+        errored = sum(1 for verdict in verdicts.values() if verdict.result.error)
+        status = "partial" if errored else "audited"
+        summary[path] = {"status": status, "cells": len(verdicts), "shapes_checked": len(requests), "flagged": flagged,
+                         "errored": errored, "report": report_path, "seconds": round(time.perf_counter() - start, 3)}
+        state[path] = {"status": status, "report": report_path, "finished_at": time.time()}
+        if not errored: #a workbook with failed checks (rate limits, outages) has no key, so the next run audits it again
+            state[path]["key"] = plan["key"]
+        _save_state(state, state_path)
+        print(f"BATCH: {path} {'done' if not errored else 'partly done'}, {len(verdicts)} cells, {flagged} flagged, {errored} checks failed")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            await asyncio.gather(*(run_job(pool, job) for job in jobs))
+    finally:
+        await client.close()
+
+    with open(os.path.join(output_dir, "batch_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="audit many workbooks with one shared LLM budget")
+    parser.add_argument("source", help="directory of workbooks, or a JSON manifest of {workbook, map}")
+    parser.add_argument("-o", "--output", default="audit_results")
+    parser.add_argument("--workers", type=int, default=None, help="processes for mapping/planning (default: cores)")
+    parser.add_argument("--concurrency", type=int, default=16, help="model calls in flight across all workbooks")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute across all workbooks")
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--annotate", action="store_true", help="also write an annotated copy of each workbook")
+    parser.add_argument("--force", action="store_true", help="re-audit unchanged workbooks too")
+    parser.add_argument("--no-llm-cache", action="store_true")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    jobs = discover(args.source)
+    print(f"BATCH: {len(jobs)} workbooks")
+    llm_cache = None if args.no_llm_cache else LLMCache()
+    start = time.perf_counter()
+    summary = asyncio.run(run_batch(jobs, args.output, workers=args.workers, concurrency=args.concurrency, tokens_per_minute=args.tpm,
+                                    cache=llm_cache, report_format=args.format, annotate=args.annotate, force=args.force))
+    if llm_cache:
+        llm_cache.close()
+    counts = {}
+    for result in summary.values():
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"BATCH: finished in {time.perf_counter() - start:.1f}s, {counts}")
@@ -0,0 +1,146 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parse
+from formula_lexer import extract_refs
+from xlsx_stream import StreamedWorkbook
+
+# Throughput of formula_lexer (what parse.extract_cells / extract_ranges use now) against the old three-regex approach.
+#
+#   python benchmarks/lexer_bench.py                  # built-in corpus
+#   python benchmarks/lexer_bench.py kc_big.xlsm      # every formula in a real workbook
+#   python benchmarks/lexer_bench.py --check-only     # just the behaviour check (exits 1 on any mismatch)
+
+CORPUS = [
+    """=IFERROR(INDEX(XLOOKUP($C65,'Master Coverage Ratios'!$I$24:$AD$24,'Master Coverage Ratios'!$I$27:$AD$61),MATCH(H$59,'Master Coverage Ratios'!$B$27:$B$61,0,$C65:$C$66)),"Unavailable")""",
+    "=SUM(E10:E17)/COUNT(E10:E17)",
+    "=IF($D12=\"\",\"\",E12*'Master Coverage Ratios'!$G$11)",
+    "=SUMIFS('Master Coverage Ratios'!$Q$11:$Q$21,'Master Coverage Ratios'!$D$11:$D$21,$D34)",
+    "=E34/F34",
+    "=ROUND(VLOOKUP($B27,'Master Coverage Ratios'!$B$27:$N$61,MATCH(C$26,'Master Coverage Ratios'!$B$26:$N$26,0),FALSE),2)",
+    "=IFERROR(E61/E$69,0)",
+    "=AVERAGE(G11:O11)*$C$3",
+    "=INDEX($Q$11:$AM$21,MATCH($D52,$D$11:$D$21,0),MATCH(E$51,$Q$10:$AM$10,0))",
+    "=SUMPRODUCT((A:A=$B4)*(C:C))",
+]
+
+
+# (formula, expected extract_cells, expected extract_ranges). The legacy regexes get every one of these wrong in some way
+# (whole columns/rows, '' escapes, string literals, function names, non-ASCII sheet names); the rest of CORPUS is checked
+# against the legacy output directly.
+BEHAVIOUR_CASES = [
+    ("=SUMPRODUCT((A:A=$B4)*(C:C))", [("no_sheet_referenced", "B4")], [("no_sheet_referenced", "A:A"), ("no_sheet_referenced", "C:C")]),
+    ("='It''s Q1'!B4+'Sheet 2'!C$5:D9", [("It's Q1", "B4")], [("Sheet 2", "C5:D9")]),
+    ("='Master Coverage Ratios'!$G$11*'Q1 (draft)'!A1", [("Master Coverage Ratios", "G11"), ("Q1 (draft)", "A1")], []),
+    ("=SUM(A:A)+SUM(3:5)+Data!$B:$C", [], [("no_sheet_referenced", "A:A"), ("no_sheet_referenced", "3:5"), ("Data", "B:C")]),
+    ('=IF(A1="B2","C3 ""D4""",E5)', [("no_sheet_referenced", "A1"), ("no_sheet_referenced", "E5")], []),
+    ("=Übersicht!A1+Übersicht!B1:B3", [("Übersicht", "A1")], [("Übersicht", "B1:B3")]),
+    ("=LOG10(A2)+[Book.xlsx]Sheet1!A1", [("no_sheet_referenced", "A2"), ("[Book.xlsx]Sheet1", "A1")], []),
+    ("=_xlfn.XLOOKUP($A1,B:B,C:C)", [("no_sheet_referenced", "A1")], [("no_sheet_referenced", "B:B"), ("no_sheet_referenced", "C:C")]),
+    ("=#REF!+1.5E+3*a$1", [("no_sheet_referenced", "A1")], []),
+]
+
+
+def check_behaviour(formulas=CORPUS):
+    """
+    parse.extract_cells / extract_ranges against the legacy regexes on formulas (where those are right) and against the
+    hand-checked BEHAVIOUR_CASES.
+
+    Returns:
+        failures (list): (formula, expected, got) for every mismatch
+    """
+    failures = []
+    hand_checked = {case[0] for case in BEHAVIOUR_CASES}
+    for formula in formulas:
+        if formula in hand_checked:
+            continue
+        expected = (legacy_extract_cells(formula), legacy_extract_ranges(formula))
+        got = (parse.extract_cells(formula), parse.extract_ranges(formula))
+        if got != expected:
+            failures.append((formula, expected, got))
+    for formula, cells, ranges in BEHAVIOUR_CASES:
+        got = (parse.extract_cells(formula), parse.extract_ranges(formula))
+        if got != (cells, ranges):
+            failures.append((formula, (cells, ranges), got))
+    return failures
+
+
+def legacy_extract_cells(formula):
+    range_pattern = r"[A-Z$]+\d+:[A-Z$]+\d+"
+    formula_without_ranges = re.sub(range_pattern, '', formula)
+    cell_pattern = r"(?:(?:'([^']+)'!))?\s*(?<!:)(\$?[A-Z]+\$?\d+)(?!:)"
+    matches = re.findall(cell_pattern, formula_without_ranges)
+    return [(sheet if sheet else "no_sheet_referenced", re.sub(r'\$', '', cell)) for sheet, cell in matches]
+
+
+def legacy_extract_ranges(formula):
+    range_pattern = r"(?:(?:'([^']+)'!))?\s*(\$?[A-Z]+\$?\d+:\$?[A-Z]+\$?\d+)"
+    matches = re.findall(range_pattern, formula)
+    return [(sheet if sheet else "no_sheet_referenced", re.sub(r'\$', '', range_ref)) for sheet, range_ref in matches]
+
+
+def load_corpus(path):
+    formulas = []
+    for sheet in StreamedWorkbook(path).iter_sheets():
+        formulas.extend(cell.formula for cell in sheet.values() if cell.formula)
+    return formulas
+
+
+def time_pass(fn, formulas, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for formula in formulas:
+            fn(formula)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="formula_lexer vs legacy regex throughput")
+    parser.add_argument("workbook", nargs="?", help=".xlsx/.xlsm to take formulas from (default: built-in corpus)")
+    parser.add_argument("--scale", type=int, default=2000, help="times to repeat the built-in corpus")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check-only", action="store_true", help="run the behaviour check and skip the timings")
+    args = parser.parse_args()
+
+    failures = check_behaviour()
+    for formula, expected, got in failures:
+        print(f"MISMATCH {formula}\n  expected {expected}\n  got      {got}")
+    print(f"behaviour check: {len(set(CORPUS) | {case[0] for case in BEHAVIOUR_CASES})} formulas, {len(failures)} mismatches")
+    if failures:
+        sys.exit(1)
+    if args.check_only:
+        return
+
+    formulas = load_corpus(args.workbook) if args.workbook else CORPUS * args.scale
+    print(f"{len(formulas)} formulas ({len(set(formulas))} distinct)")
+
+    def legacy(formula):
+        legacy_extract_cells(formula)
+        legacy_extract_ranges(formula)
+
+    def lexer_cold(formula):
+        extract_refs.__wrapped__(formula)
+
+    def lexer(formula):
+        parse.extract_cells(formula)
+        parse.extract_ranges(formula)
+
+    results = {
+        "legacy regex (cells + ranges)": time_pass(legacy, formulas, args.repeat),
+        "lexer, no memo (one scan)": time_pass(lexer_cold, formulas, args.repeat),
+        "lexer, memoized (cells + ranges)": time_pass(lexer, formulas, args.repeat),
+    }
+    baseline = results["legacy regex (cells + ranges)"]
+    for name, seconds in results.items():
+        print(f"{name:34} {seconds:8.4f}s  {len(formulas) / seconds:12,.0f} formulas/s  {baseline / seconds:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
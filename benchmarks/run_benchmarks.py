@@ -0,0 +1,199 @@
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import contextlib
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parse
+import audit
+import semantic_map
+from formula_lexer import extract_refs
+from stub_llm_server import make_server
+from workbook_session import WorkbookSession
+from synthetic import generate
+
+# Times and memory-profiles each stage of the mapping / context pipeline on synthetic workbooks of increasing size, and
+# compares against a saved run so regressions show up. Fully offline: the audit stage talks to stub_llm_server.py on localhost.
+#
+#   python benchmarks/run_benchmarks.py                                # small + medium, results in benchmarks/results/
+#   python benchmarks/run_benchmarks.py --scales small,medium,large -o before.json
+#   python benchmarks/run_benchmarks.py --compare before.json          # exit 1 if any stage got more than --threshold slower
+
+SCALES = {
+    "small": {"sheets": 2, "tables": 2, "rows": 50, "cols": 10},
+    "medium": {"sheets": 4, "tables": 3, "rows": 300, "cols": 20},
+    "large": {"sheets": 6, "tables": 4, "rows": 1000, "cols": 30},
+}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _all_formulas(workbook):
+    return [(sheet.title, cell.formula) for sheet in workbook.iter_sheets() for cell in sheet.values() if cell.formula]
+
+
+def stage_load(ctx):
+    workbook = WorkbookSession(streaming=True).get_workbook(ctx["path"])
+    for title in workbook.sheetnames:
+        workbook[title]
+    ctx["workbook"] = workbook
+    return sum(len(workbook[title]) for title in workbook.sheetnames)
+
+
+def stage_semantic_map(ctx):
+    ctx["cell_lookup"] = semantic_map.semantic_map_workbook(ctx["workbook_map"], session=WorkbookSession(streaming=True))
+    return sum(len(sheet_index) for sheet_index in ctx["cell_lookup"].values())
+
+
+def stage_extract(ctx):
+    extract_refs.cache_clear() #cold lexer, otherwise every repeat after the first is just lru_cache hits
+    for _, formula in ctx["formulas"]:
+        parse.extract_cells(formula)
+        parse.extract_ranges(formula)
+    return len(ctx["formulas"])
+
+
+def stage_formula_context(ctx):
+    parse.clear_range_summary_cache()
+    for ws_title, formula in ctx["context_sample"]:
+        parse.formula_context(formula, ws_title, ctx["cell_lookup"], ctx["workbook"])
+    return len(ctx["context_sample"])
+
+
+def stage_audit(ctx):
+    verdicts = audit.audit_workbook(ctx["workbook_map"], ctx["cell_lookup"], ctx["workbook"], progress=None, concurrency=32,
+                                    client_kwargs={"api_key": "stub", "base_url": ctx["llm_url"]})
+    return len(verdicts)
+
+
+STAGES = [
+    ("load", stage_load),
+    ("semantic_map_workbook", stage_semantic_map),
+    ("extract_cells+extract_ranges", stage_extract),
+    ("formula_context", stage_formula_context),
+    ("audit (stub LLM)", stage_audit),
+]
+
+
+def measure(fn, ctx, repeat):
+    """
+    Best-of-repeat wall time, then one extra pass under tracemalloc for the peak (tracemalloc slows things down too much to
+    time under it). Pipeline output (RANGE_CONTEXT notices, audit progress) is discarded.
+
+    Returns:
+        result (dict): seconds, peak_kb, items (what the stage processed: cells, formulas, ...), per_item_us
+    """
+    best = float("inf")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            items = fn(ctx)
+            best = min(best, time.perf_counter() - start)
+        gc.collect()
+        tracemalloc.start()
+        fn(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"seconds": round(best, 6), "peak_kb": peak >> 10, "items": items, "per_item_us": round(best / max(items, 1) * 1e6, 3)}
+
+
+def run_scale(name, params, workdir, llm_url, repeat, context_sample, formula_density, cross_sheet):
+    path = os.path.join(workdir, f"synthetic_{name}.xlsx")
+    start = time.perf_counter()
+    workbook_map = generate(path, formula_density=formula_density, cross_sheet=cross_sheet, **params)
+    print(f"[{name}] generated {path} in {time.perf_counter() - start:.1f}s")
+
+    ctx = {"path": path, "workbook_map": workbook_map, "llm_url": llm_url}
+    stage_load(ctx)
+    stage_semantic_map(ctx)
+    ctx["formulas"] = _all_formulas(ctx["workbook"])
+    step = max(len(ctx["formulas"]) // context_sample, 1) if context_sample else 1
+    ctx["context_sample"] = ctx["formulas"][::step][:context_sample or None]
+
+    stages = {}
+    for stage_name, fn in STAGES:
+        stages[stage_name] = measure(fn, ctx, repeat)
+        result = stages[stage_name]
+        print(f"[{name}] {stage_name:<30} {result['seconds']:>9.4f}s  peak {result['peak_kb']:>8} KB  {result['items']:>8} items  {result['per_item_us']:>10.2f} us/item")
+    return {"params": dict(params, formula_density=formula_density, cross_sheet=cross_sheet), "formulas": len(ctx["formulas"]), "stages": stages}
+
+
+def compare(results, baseline, threshold):
+    """
+    Print old vs new per stage. Returns the list of (scale, stage, ratio) that got slower than threshold.
+    """
+    regressions = []
+    print(f"\nvs {baseline['meta']['timestamp']} ({baseline['meta'].get('label') or 'no label'})")
+    for scale, scale_results in results["scales"].items():
+        old_scale = baseline["scales"].get(scale)
+        if old_scale is None:
+            print(f"[{scale}] not in baseline")
+            continue
+        if old_scale["params"] != scale_results["params"]:
+            print(f"[{scale}] params differ from baseline, comparing anyway")
+        for stage, new in scale_results["stages"].items():
+            old = old_scale["stages"].get(stage)
+            if old is None:
+                continue
+            ratio = new["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+            memory_ratio = new["peak_kb"] / old["peak_kb"] if old["peak_kb"] else float("inf")
+            flag = "  REGRESSION" if ratio > threshold else ""
+            print(f"[{scale}] {stage:<30} {old['seconds']:>9.4f}s -> {new['seconds']:>9.4f}s ({ratio:.2f}x)  peak {memory_ratio:.2f}x{flag}")
+            if ratio > threshold:
+                regressions.append((scale, stage, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the mapping / context pipeline on synthetic workbooks")
+    parser.add_argument("--scales", default="small,medium", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--context-sample", type=int, default=2000, help="formulas per scale run through formula_context (0 for all)")
+    parser.add_argument("--formula-density", type=float, default=0.5)
+    parser.add_argument("--cross-sheet", type=float, default=0.2)
+    parser.add_argument("--workdir", help="where generated workbooks go (default: a temp dir, deleted afterwards)")
+    parser.add_argument("-o", "--output", help="results JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--label", default="", help="free text saved with the results, e.g. a branch name")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    results = {
+        "meta": {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "label": args.label,
+                 "python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat,
+                 "context_sample": args.context_sample},
+        "scales": {},
+    }
+    with (contextlib.nullcontext(args.workdir) if args.workdir else tempfile.TemporaryDirectory()) as workdir:
+        for name in args.scales.split(","):
+            results["scales"][name] = run_scale(name, SCALES[name], workdir, llm_url, args.repeat, args.context_sample,
+                                                args.formula_density, args.cross_sheet)
+    server.shutdown()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['meta']['timestamp'].replace(':', '')}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than {args.threshold}x")
+            sys.exit(1)
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+# Synthetic workbooks for benchmarking, plus the workbook_map.json that describes them.
+#
+# Every sheet is a column of tables stacked top to bottom: a title row, a header row (col descriptors), then rows of
+# "Line n" (row descriptors) followed by data cells. formula_density of the data cells are formulas, the rest are numbers.
+# Formulas are a mix of neighbour arithmetic, row SUMs, and (cross_sheet of them) INDEX/MATCH lookups into a table on
+# another sheet, which is the shape that sends formula_context through range_to_context and the value fallbacks.
+#
+#   python benchmarks/synthetic.py synth.xlsx --sheets 4 --tables 3 --rows 300 --cols 20 -m synth_map.json
+
+TABLE_GAP = 2 #empty rows between tables
+FIRST_COL = 2 #descriptor column is B, data starts at C
+
+
+def _table_layout(tables, rows, cols):
+    """
+    Returns:
+        layout (list): (title_row, header_row, first_data_row, last_data_row) per table, same on every sheet
+    """
+    layout = []
+    row = 1
+    for _ in range(tables):
+        layout.append((row, row + 1, row + 2, row + 1 + rows))
+        row += rows + 2 + TABLE_GAP
+    return layout
+
+
+def _lookup_formula(coord_row, data_col_letter, target_sheet, target_table, cols):
+    _, header_row, first_row, last_row = target_table
+    first_data, last_data = get_column_letter(FIRST_COL + 1), get_column_letter(FIRST_COL + cols)
+    descriptor = get_column_letter(FIRST_COL)
+    return (f"=INDEX('{target_sheet}'!${first_data}${first_row}:${last_data}${last_row},"
+            f"MATCH(${descriptor}{coord_row},'{target_sheet}'!${descriptor}${first_row}:${descriptor}${last_row},0),"
+            f"MATCH({data_col_letter}${header_row},'{target_sheet}'!${first_data}${header_row}:${last_data}${header_row},0))")
+
+
+def generate(path, sheets=2, tables=2, rows=50, cols=10, formula_density=0.5, cross_sheet=0.2, seed=0):
+    """
+    Write a synthetic workbook to path (write-only openpyxl, so even large ones don't sit in memory).
+
+    Args:
+        sheets / tables / rows / cols (int): sheet count, tables per sheet, data rows and data columns per table
+
+        formula_density (float): share of data cells that are formulas
+
+        cross_sheet (float): share of formulas that are lookups into the previous sheet (needs sheets > 1)
+
+        seed (int): same arguments + seed always give the same workbook
+
+    Returns:
+        workbook_map (dict): workbook_map.json for the generated workbook
+    """
+    rng = random.Random(seed)
+    layout = _table_layout(tables, rows, cols)
+    titles = [f"Sheet {i + 1} | Synthetic" for i in range(sheets)]
+    workbook = Workbook(write_only=True)
+    workbook_map = {"wb_title": path, "wb_purpose": "Synthetic benchmark workbook", "worksheets": []}
+
+    for sheet_number, ws_title in enumerate(titles):
+        ws = workbook.create_sheet(ws_title)
+        target_sheet = titles[sheet_number - 1] if sheet_number > 0 else None
+        tables_map = []
+        for table_number, (_, header_row, first_row, last_row) in enumerate(layout): #tables are appended in order with TABLE_GAP blank rows after each, so rows line up with layout
+            ws.append([None] * (FIRST_COL - 1) + [f"Table {table_number + 1}"])
+            ws.append([None] * (FIRST_COL - 1) + ["Line item"] + [f"Period {c + 1}" for c in range(cols)])
+            for row in range(first_row, last_row + 1):
+                values = [None] * (FIRST_COL - 1) + [f"Line {row - first_row + 1}"]
+                for c in range(cols):
+                    col_letter = get_column_letter(FIRST_COL + 1 + c)
+                    if rng.random() >= formula_density:
+                        values.append(round(rng.uniform(0, 10000), 2))
+                    elif target_sheet and rng.random() < cross_sheet:
+                        values.append(_lookup_formula(row, col_letter, target_sheet, layout[table_number % len(layout)], cols))
+                    elif c > 0 and rng.random() < 0.5:
+                        values.append(f"={get_column_letter(FIRST_COL + c)}{row}*1.05")
+                    else:
+                        values.append(f"=SUM(${get_column_letter(FIRST_COL + 1)}{row}:{col_letter}{row})/{c + 1}")
+                ws.append(values)
+            for _ in range(TABLE_GAP):
+                ws.append([])
+
+            descriptor = get_column_letter(FIRST_COL)
+            tables_map.append({
+                "title": f"Table {table_number + 1}",
+                "col_descriptors": f"{descriptor}{header_row}:{get_column_letter(FIRST_COL + cols)}{header_row}",
+                "row_descriptors": f"{descriptor}{first_row}:{descriptor}{last_row}",
+                "check_cell_range": f"{get_column_letter(FIRST_COL + 1)}{first_row}:{get_column_letter(FIRST_COL + cols)}{last_row}",
+            })
+        workbook_map["worksheets"].append({"ws_title": ws_title, "tables": tables_map})
+
+    workbook.save(path)
+    return workbook_map
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate a synthetic workbook + workbook_map.json")
+    parser.add_argument("output", help=".xlsx to write")
+    parser.add_argument("-m", "--map", help="where to write the workbook_map (default: <output>.map.json)")
+    parser.add_argument("--sheets", type=int, default=2)
+    parser.add_argument("--tables", type=int, default=2, help="tables per sheet")
+    parser.add_argument("--rows", type=int, default=50, help="data rows per table")
+    parser.add_argument("--cols", type=int, default=10, help="data columns per table")
+    parser.add_argument("--formula-density", type=float, default=0.5)
+    parser.add_argument("--cross-sheet", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workbook_map = generate(args.output, sheets=args.sheets, tables=args.tables, rows=args.rows, cols=args.cols,
+                            formula_density=args.formula_density, cross_sheet=args.cross_sheet, seed=args.seed)
+    map_path = args.map or f"{os.path.splitext(args.output)[0]}.map.json"
+    with open(map_path, "w") as f:
+        json.dump(workbook_map, f, indent=2)
+    print(f"Saved {args.output} and {map_path}")
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import map_cache
+import parse
+from value_index import ValueProvider
+from workbook_session import WorkbookSession
+
+# Long-running context server. Loads each workbook's semantic map once (through map_cache, so a restart on an unchanged
+# workbook is instant too) and answers parse.formula_context queries over local HTTP, so callers don't pay workbook parsing
+# and semantic mapping per query.
+#
+#   python context_server.py workbook_map.json [other_map.json ...] --port 8770
+#
+#   POST /context {"sheet": "S9-13, 29-36 | Ratio Summaries", "formula": "=SUM('Master Coverage Ratios'!I27:I61)"}
+#   POST /context {"sheet": "S9-13, 29-36 | Ratio Summaries", "cell": "H65"}
+#   GET  /status
+#
+# Add "workbook": <wb_title> when more than one workbook is loaded, and "compact": true for the token-capped range summaries.
+# A workbook (or its map file) that changes on disk is reloaded on the next request that needs it.
+
+_COORD = re.compile(r"^[A-Z]{1,3}[0-9]+$")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class LoadedWorkbook:
+    """
+    One workbook_map.json and everything context generation needs for it: the semantic map and a lazy value/formula index.
+    """
+
+    def __init__(self, map_path):
+        self.map_path = map_path
+        self.reloads = 0
+        self.values = None
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock() #guards the swap below and _in_use, never held while loading
+        self._in_use = {} #{ValueProvider: requests currently reading it}
+        self._load()
+
+    def _load(self):
+        with open(self.map_path, "r") as f:
+            workbook_map = json.load(f)
+        path = workbook_map["wb_title"]
+        mtimes = (_mtime(self.map_path), _mtime(path))
+        cell_lookup, _ = map_cache.load_semantic_map(workbook_map, session=WorkbookSession(streaming=True, max_sheets=1)) #only needed to read headers, one sheet at a time
+        values = ValueProvider(path)
+        # swap everything in at once, so a request that's already running keeps a consistent (old) snapshot
+        with self._snapshot_lock:
+            old_values = self.values
+            self.workbook_map, self.path, self.mtimes = workbook_map, path, mtimes
+            self.cell_lookup, self.values = cell_lookup, values
+            self.loaded_at = time.time()
+            if old_values is not None and old_values not in self._in_use:
+                old_values.close() #otherwise the last request still reading it closes it, see _release
+
+    def refresh(self):
+        """
+        Reload if the workbook or its map changed on disk since the last load. Returns True if it reloaded.
+        """
+        if (_mtime(self.map_path), _mtime(self.path)) == self.mtimes:
+            return False
+        with self._lock: #concurrent requests that notice the change wait for a single reload
+            if (_mtime(self.map_path), _mtime(self.path)) == self.mtimes:
+                return False
+            self._load()
+            self.reloads += 1
+            parse.clear_range_summary_cache()
+            print(f"CONTEXT_SERVER: reloaded {self.path}")
+            return True
+
+    def context(self, sheet, formula=None, cell=None, compact=False):
+        """
+        Args:
+            sheet (str): sheet the formula (or cell) is on
+
+            formula (str): "=..." to describe, or
+
+            cell (str): coord whose own formula is described (or, if it holds a plain value, the cell itself)
+
+        Returns:
+            (formula, context): formula is None when the cell has no formula
+        """
+        self.refresh()
+        cell_lookup, values = self._acquire()
+        try:
+            if formula is None:
+                formula = values[sheet][cell].formula
+                if formula is None:
+                    return None, parse.cell_to_context(cell, sheet, sheet, cell_lookup, values)
+            return formula, parse.formula_context(formula, sheet, cell_lookup, values, compact=compact)
+        finally:
+            self._release(values)
+
+    def _acquire(self):
+        with self._snapshot_lock:
+            self._in_use[self.values] = self._in_use.get(self.values, 0) + 1
+            return self.cell_lookup, self.values
+
+    def _release(self, values):
+        with self._snapshot_lock:
+            self._in_use[values] -= 1
+            if self._in_use[values] == 0:
+                del self._in_use[values]
+                if values is not self.values: #replaced by a reload while this request was using it
+                    values.close()
+
+    def status(self):
+        return {
+            "workbook": self.path,
+            "map": self.map_path,
+            "sheets": len(self.cell_lookup),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "value_index": self.values.stats,
+        }
+
+
+class ContextHandler(BaseHTTPRequestHandler):
+    workbooks = {} #{wb_title: LoadedWorkbook}, set by make_server
+    requests_served = 0
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self._send(404, {"error": "not found"})
+        self._send(200, {"requests_served": self.requests_served, "range_context": parse.range_context_stats,
+                         "workbooks": [workbook.status() for workbook in self.workbooks.values()]})
+
+    def do_POST(self):
+        if self.path != "/context":
+            return self._send(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError as e: #bad JSON, bad Content-Length
+            return self._send(400, {"error": f"bad request body: {e}"})
+
+        error = self._validate(body)
+        if error:
+            return self._send(400, {"error": error})
+        workbook = self._workbook(body.get("workbook"))
+        if workbook is None:
+            return self._send(404, {"error": f"workbook not loaded: {body.get('workbook')}", "loaded": list(self.workbooks)})
+
+        start = time.perf_counter()
+        cell = body["cell"].replace("$", "").upper() if "cell" in body else None
+        try:
+            formula, context = workbook.context(body["sheet"], formula=body.get("formula"), cell=cell, compact=bool(body.get("compact")))
+        except KeyError as e:
+            return self._send(404, {"error": f"unknown sheet: {e}"})
+        except Exception as e: #a bad formula or workbook shouldn't drop the connection without an answer
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        type(self).requests_served += 1
+        self._send(200, {"formula": formula, "context": context, "ms": round((time.perf_counter() - start) * 1000, 3)})
+
+    @staticmethod
+    def _validate(body):
+        """
+        Returns:
+            error (str): what's wrong with a /context request body, None if it's fine
+        """
+        if not isinstance(body, dict):
+            return "body must be a JSON object"
+        if "sheet" not in body or ("formula" in body) == ("cell" in body):
+            return "need 'sheet' and exactly one of 'formula' / 'cell'"
+        for field in ("sheet", "formula", "cell", "workbook"):
+            if field in body and not isinstance(body[field], str):
+                return f"'{field}' must be a string"
+        if "cell" in body and not _COORD.match(body["cell"].replace("$", "").upper()):
+            return f"'cell' must be an A1 coordinate, got {body['cell']!r}"
+        if "compact" in body and not isinstance(body["compact"], bool):
+            return "'compact' must be true or false"
+        return None
+
+    def _workbook(self, wb_title):
+        if wb_title is None and len(self.workbooks) == 1:
+            return next(iter(self.workbooks.values()))
+        return self.workbooks.get(wb_title)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(map_paths, host="127.0.0.1", port=8770):
+    """
+    Load every workbook_map up front and return a ThreadingHTTPServer (one thread per client connection). Call serve_forever() on it.
+    """
+    workbooks = {}
+    for map_path in map_paths:
+        workbook = LoadedWorkbook(map_path)
+        workbooks[workbook.path] = workbook
+        print(f"CONTEXT_SERVER: loaded {workbook.path} ({len(workbook.cell_lookup)} sheets)")
+    handler = type("BoundContextHandler", (ContextHandler,), {"workbooks": workbooks})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serve formula context for one or more workbooks")
+    parser.add_argument("maps", nargs="*", default=["workbook_map.json"], help="workbook_map.json files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    server = make_server(args.maps, host=args.host, port=args.port)
+    print(f"Context server on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,421 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+import random
+import re
+from openpyxl.utils import column_index_from_string, get_column_letter, range_boundaries
+import parse
+
+# Precedent/dependent graph over every formula cell in a workbook, built from parse.extract_cells / extract_ranges.
+#
+# Layout (everything is int ids in flat arrays so it scales to hundreds of thousands of formulas):
+#   nodes     - every cell that shows up, either as a formula or as something a formula points at. key = (sheet id, col, row)
+#   formulas  - the subset of nodes that hold a formula, numbered 0..F-1
+#   ranges    - each distinct range is stored once as an interval (sheet, min_col, min_row, max_col, max_row), never expanded
+#   edges     - CSR adjacency: formula f's cell precedents are cell_dst[cell_ptr[f]:cell_ptr[f+1]], its range precedents are
+#               range_dst[range_ptr[f]:range_ptr[f+1]]. Reverse edges are built the same way for the dependents side.
+#   spans     - ranges grouped by (sheet, min_col, max_col), each group a segment tree over its ranges' row endpoints
+#               (_RowIntervals). "Which ranges contain this cell" walks one leaf-to-root path per group, so it costs
+#               O(log n + answer) even when thousands of ranges overlap (running totals like =SUM($B$2:Bn)), and the
+#               tree nodes double as intermediate vertices for topological_order, so no range is ever expanded into
+#               the formulas inside it.
+
+MAX_ROW = 1048576
+MAX_COL = 16384
+WIDE_COLS = 64 #span groups wider than this (whole rows, A:Z blocks) go on a per-sheet list instead of under every column
+SKETCH_SIZE = 64 #ranks kept per vertex by impact_scores, reachable sets up to this size are counted exactly
+
+_COORD = re.compile(r"^([A-Z]{1,3})(\d+)$")
+
+
+def _split(coord):
+    match = _COORD.match(coord)
+    return column_index_from_string(match.group(1)), int(match.group(2))
+
+
+def _csr(count, pairs):
+    """
+    Build (ptr, dst) arrays from (source, target) pairs with sources in 0..count-1.
+    """
+    degree = [0] * (count + 1)
+    for source, _ in pairs:
+        degree[source + 1] += 1
+    for i in range(count):
+        degree[i + 1] += degree[i]
+    ptr = array("i", degree)
+    dst = array("i", bytes(4 * len(pairs)))
+    fill = list(degree[:-1])
+    for source, target in pairs:
+        dst[fill[source]] = target
+        fill[source] += 1
+    return ptr, dst
+
+
+class _RowIntervals:
+    """
+    Segment tree over the row intervals of every range with the same (sheet, min_col, max_col). Leaves are the elementary row
+    intervals between consecutive range endpoints; each range is attached to the O(log n) tree nodes that exactly cover it.
+    Node i's children are 2i and 2i+1, leaves are size..2*size-1 (bottom-up layout, size needn't be a power of two).
+    """
+
+    __slots__ = ("sheet_id", "min_col", "max_col", "coords", "size", "node_ranges", "base")
+
+    def __init__(self, sheet_id, min_col, max_col, intervals):
+        self.sheet_id, self.min_col, self.max_col = sheet_id, min_col, max_col
+        self.coords = sorted({row for min_row, max_row, _ in intervals for row in (min_row, max_row + 1)})
+        self.size = len(self.coords) - 1
+        self.node_ranges = {} #{tree node: [range ids]}
+        self.base = 0 #vertex id of node 0 in topological_order's combined graph, set by DependencyGraph.finish
+        for min_row, max_row, range_id in intervals:
+            low = bisect_left(self.coords, min_row) + self.size
+            high = bisect_left(self.coords, max_row + 1) + self.size
+            while low < high:
+                if low & 1:
+                    self.node_ranges.setdefault(low, []).append(range_id)
+                    low += 1
+                if high & 1:
+                    high -= 1
+                    self.node_ranges.setdefault(high, []).append(range_id)
+                low //= 2
+                high //= 2
+
+    def leaf(self, row):
+        """
+        Tree node of the leaf holding row, None if no range in this group reaches that row.
+        """
+        if row < self.coords[0] or row >= self.coords[-1]:
+            return None
+        return bisect_right(self.coords, row) - 1 + self.size
+
+
+class DependencyGraph:
+    def __init__(self):
+        self.sheets = []
+        self._sheet_ids = {}
+        self._node_keys = []
+        self._node_ids = {}
+        self.formula_nodes = array("i") #formula id -> node id
+        self._formula_ids = {} #node id -> formula id
+        self.rng_sheet, self.rng_min_col, self.rng_min_row, self.rng_max_col, self.rng_max_row = (array("i") for _ in range(5))
+        self._range_ids = {}
+        self._cell_edges = [] #(formula id, node id), packed into CSR by finish()
+        self._range_edges = [] #(formula id, range id)
+
+    # building
+
+    def _sheet(self, ws_title):
+        if ws_title not in self._sheet_ids:
+            self._sheet_ids[ws_title] = len(self.sheets)
+            self.sheets.append(ws_title)
+        return self._sheet_ids[ws_title]
+
+    def _node(self, sheet_id, col, row):
+        key = (sheet_id, col, row)
+        node = self._node_ids.get(key)
+        if node is None:
+            node = self._node_ids[key] = len(self._node_keys)
+            self._node_keys.append(key)
+        return node
+
+    def _range(self, sheet_id, ref):
+        key = (sheet_id, ref)
+        range_id = self._range_ids.get(key)
+        if range_id is None:
+            min_col, min_row, max_col, max_row = range_boundaries(ref)
+            range_id = self._range_ids[key] = len(self.rng_sheet)
+            self.rng_sheet.append(sheet_id)
+            self.rng_min_col.append(min_col or 1)
+            self.rng_min_row.append(min_row or 1)
+            self.rng_max_col.append(max_col or MAX_COL)
+            self.rng_max_row.append(max_row or MAX_ROW)
+        return range_id
+
+    def add_formula(self, ws_title, coord, formula):
+        """
+        Add one formula cell and its references. Call finish() once everything is added.
+        """
+        sheet_id = self._sheet(ws_title)
+        node = self._node(sheet_id, *_split(coord))
+        formula_id = len(self.formula_nodes)
+        self.formula_nodes.append(node)
+        self._formula_ids[node] = formula_id
+
+        for cell_ws, ref in parse.extract_cells(formula):
+            ref_sheet = sheet_id if cell_ws == "no_sheet_referenced" else self._sheet(cell_ws)
+            self._cell_edges.append((formula_id, self._node(ref_sheet, *_split(ref))))
+        for range_ws, ref in parse.extract_ranges(formula):
+            ref_sheet = sheet_id if range_ws == "no_sheet_referenced" else self._sheet(range_ws)
+            self._range_edges.append((formula_id, self._range(ref_sheet, ref)))
+
+    def finish(self):
+        """
+        Pack the edge lists into CSR arrays and build the reverse edges + range interval index.
+        """
+        formula_count = len(self.formula_nodes)
+        self.cell_ptr, self.cell_dst = _csr(formula_count, self._cell_edges)
+        self.range_ptr, self.range_dst = _csr(formula_count, self._range_edges)
+        self.cell_dep_ptr, self.cell_dep_dst = _csr(len(self._node_keys), [(node, f) for f, node in self._cell_edges])
+        self.range_dep_ptr, self.range_dep_dst = _csr(len(self.rng_sheet), [(r, f) for f, r in self._range_edges])
+        self._cell_edges, self._range_edges = [], []
+
+        spans = {} #{(sheet id, min_col, max_col): [(min_row, max_row, range id)]}
+        for range_id in range(len(self.rng_sheet)):
+            key = (self.rng_sheet[range_id], self.rng_min_col[range_id], self.rng_max_col[range_id])
+            spans.setdefault(key, []).append((self.rng_min_row[range_id], self.rng_max_row[range_id], range_id))
+
+        self._spans = [] #[_RowIntervals]
+        self._span_index = {} #{(sheet id, col): [span ids]}
+        self._wide_spans = {} #{sheet id: [span ids]}
+        base = len(self.formula_nodes) + len(self.rng_sheet) #combined-graph vertex ids: formulas, then ranges, then tree nodes
+        for (sheet_id, min_col, max_col), intervals in spans.items():
+            span_id = len(self._spans)
+            span = _RowIntervals(sheet_id, min_col, max_col, intervals)
+            span.base = base
+            base += 2 * span.size
+            self._spans.append(span)
+            if max_col - min_col >= WIDE_COLS:
+                self._wide_spans.setdefault(sheet_id, []).append(span_id)
+            else:
+                for col in range(min_col, max_col + 1):
+                    self._span_index.setdefault((sheet_id, col), []).append(span_id)
+        self._vertex_count = base
+        return self
+
+    # helpers
+
+    def _key(self, ws_title, coord):
+        return (self._sheet_ids.get(ws_title, -1), *_split(coord))
+
+    def _cell_name(self, node):
+        sheet_id, col, row = self._node_keys[node]
+        return (self.sheets[sheet_id], f"{get_column_letter(col)}{row}")
+
+    def _range_name(self, range_id):
+        return (self.sheets[self.rng_sheet[range_id]],
+                f"{get_column_letter(self.rng_min_col[range_id])}{self.rng_min_row[range_id]}:{get_column_letter(self.rng_max_col[range_id])}{self.rng_max_row[range_id]}")
+
+    def _spans_containing(self, sheet_id, col):
+        for span_id in self._span_index.get((sheet_id, col), ()):
+            yield span_id
+        for span_id in self._wide_spans.get(sheet_id, ()):
+            span = self._spans[span_id]
+            if span.min_col <= col <= span.max_col:
+                yield span_id
+
+    def _ranges_containing(self, sheet_id, col, row, visited=None):
+        """
+        Range ids containing (sheet, col, row). With visited (a set shared across calls), tree nodes already walked are
+        skipped, so a traversal over many cells reports each tree node's ranges once in total.
+        """
+        found = []
+        for span_id in self._spans_containing(sheet_id, col):
+            span = self._spans[span_id]
+            node = span.leaf(row)
+            while node:
+                if visited is not None:
+                    if (span_id, node) in visited:
+                        break #and so were all of its ancestors
+                    visited.add((span_id, node))
+                found.extend(span.node_ranges.get(node, ()))
+                node //= 2
+        return found
+
+    def _dependent_formulas(self, sheet_id, col, row, visited=None, seen_ranges=None):
+        """
+        Formula ids that reference (sheet, col, row) directly or through a range. visited / seen_ranges: see _ranges_containing,
+        ranges in seen_ranges are skipped (and new ones added).
+        """
+        found = []
+        node = self._node_ids.get((sheet_id, col, row))
+        if node is not None:
+            found.extend(self.cell_dep_dst[self.cell_dep_ptr[node]:self.cell_dep_ptr[node + 1]])
+        for range_id in self._ranges_containing(sheet_id, col, row, visited):
+            if seen_ranges is not None:
+                if range_id in seen_ranges:
+                    continue
+                seen_ranges.add(range_id)
+            found.extend(self.range_dep_dst[self.range_dep_ptr[range_id]:self.range_dep_ptr[range_id + 1]])
+        return found
+
+    def _combined_graph(self):
+        """
+        Downstream adjacency over formulas + ranges + span tree nodes: formula -> the leaf holding it in every span that
+        covers its column -> parent nodes -> ranges attached there -> formulas reading the range. Reachability between
+        formulas is exactly the dependency relation, but the edge count stays linear instead of (formulas x ranges).
+
+        Returns:
+            downstream (list): downstream[vertex] = [vertices]
+        """
+        formula_count, range_count = len(self.formula_nodes), len(self.rng_sheet)
+        downstream = [[] for _ in range(self._vertex_count)]
+        for f in range(formula_count):
+            node = self.formula_nodes[f]
+            sheet_id, col, row = self._node_keys[node]
+            downstream[f].extend(self.cell_dep_dst[self.cell_dep_ptr[node]:self.cell_dep_ptr[node + 1]])
+            for span_id in self._spans_containing(sheet_id, col):
+                span = self._spans[span_id]
+                leaf = span.leaf(row)
+                if leaf is not None:
+                    downstream[f].append(span.base + leaf)
+        for r in range(range_count):
+            downstream[formula_count + r].extend(self.range_dep_dst[self.range_dep_ptr[r]:self.range_dep_ptr[r + 1]])
+        for span in self._spans:
+            for tree_node in range(2, 2 * span.size):
+                downstream[span.base + tree_node].append(span.base + tree_node // 2)
+            for tree_node, range_ids in span.node_ranges.items():
+                downstream[span.base + tree_node].extend(formula_count + r for r in range_ids)
+        return downstream
+
+    def _combined_order(self):
+        """
+        Kahn's algorithm over _combined_graph.
+
+        Returns:
+            (order, downstream): order is the vertices that aren't on or behind a cycle, in dependency order
+        """
+        downstream = self._combined_graph()
+        remaining = array("i", bytes(4 * self._vertex_count))
+        for targets in downstream:
+            for v in targets:
+                remaining[v] += 1
+        queue = deque(v for v in range(self._vertex_count) if remaining[v] == 0)
+        order = []
+        while queue:
+            v = queue.popleft()
+            order.append(v)
+            for d in downstream[v]:
+                remaining[d] -= 1
+                if remaining[d] == 0:
+                    queue.append(d)
+        return order, downstream
+
+    # queries
+
+    def precedents(self, ws_title, coord):
+        """
+        What feeds this cell.
+
+        Returns:
+            (cells, ranges): [(ws_title, coord)] and [(ws_title, "A1:B9")] referenced by the formula in this cell (empty if it's not a formula)
+        """
+        node = self._node_ids.get(self._key(ws_title, coord))
+        formula_id = self._formula_ids.get(node)
+        if formula_id is None:
+            return [], []
+        cells = [self._cell_name(n) for n in self.cell_dst[self.cell_ptr[formula_id]:self.cell_ptr[formula_id + 1]]]
+        ranges = [self._range_name(r) for r in self.range_dst[self.range_ptr[formula_id]:self.range_ptr[formula_id + 1]]]
+        return cells, ranges
+
+    def dependents(self, ws_title, coord):
+        """
+        What this cell feeds.
+
+        Returns:
+            dependents (list): [(ws_title, coord)] of formula cells that reference this cell, directly or through a range
+        """
+        formula_ids = self._dependent_formulas(*self._key(ws_title, coord))
+        return [self._cell_name(self.formula_nodes[f]) for f in dict.fromkeys(formula_ids)]
+
+    def transitive_dependents(self, keys):
+        """
+        Every formula cell downstream of any of keys.
+
+        Args:
+            keys (iterable): (ws_title, coord) pairs
+
+        Returns:
+            downstream (set): (ws_title, coord) of formula cells reached (the starting keys aren't included unless they're downstream of each other)
+        """
+        seen = set()
+        visited, seen_ranges = set(), set()
+        queue = deque()
+        for ws_title, coord in keys:
+            queue.extend(self._dependent_formulas(*self._key(ws_title, coord), visited, seen_ranges))
+        while queue:
+            formula_id = queue.popleft()
+            if formula_id in seen:
+                continue
+            seen.add(formula_id)
+            sheet_id, col, row = self._node_keys[self.formula_nodes[formula_id]]
+            queue.extend(f for f in self._dependent_formulas(sheet_id, col, row, visited, seen_ranges) if f not in seen)
+        return {self._cell_name(self.formula_nodes[f]) for f in seen}
+
+    def topological_order(self):
+        """
+        Formula cells ordered so every formula comes after the formulas it reads from (Kahn's algorithm over _combined_graph).
+
+        Returns:
+            (order, cyclic): order is [(ws_title, coord)], cyclic is the formula cells caught in (or downstream of) circular
+            references, self references included (appended to the end of order)
+        """
+        formula_count = len(self.formula_nodes)
+        order = [v for v in self._combined_order()[0] if v < formula_count]
+        placed = set(order)
+        cyclic = [f for f in range(formula_count) if f not in placed]
+        names = [self._cell_name(self.formula_nodes[f]) for f in order + cyclic]
+        return names, names[len(order):]
+
+    def impact_scores(self, seed=0):
+        """
+        How much of the workbook each formula feeds, for checking the highest-impact cells first.
+
+        Score = size of the formula's reachable set (itself + every formula downstream of it). Exact sets are quadratic, so
+        every vertex keeps a bottom-k sketch instead: the SKETCH_SIZE smallest random ranks among the formulas it reaches,
+        merged in one pass in reverse topological order. Sets up to SKETCH_SIZE are counted exactly, bigger ones are
+        estimated as (k - 1) / (k-th smallest rank), good to about 1/sqrt(SKETCH_SIZE), plenty for ranking. Formulas on a
+        cycle aren't scored.
+
+        Returns:
+            scores (dict): {(ws_title, coord): score}, sorted highest first
+        """
+        formula_count = len(self.formula_nodes)
+        order, downstream = self._combined_order()
+        rng = random.Random(seed)
+        placed = set(order)
+        pending = array("i", bytes(4 * self._vertex_count)) #upstream vertices still to read each sketch, so it can be freed
+        for v in order:
+            for d in downstream[v]:
+                if d in placed:
+                    pending[d] += 1
+
+        sketches = {}
+        scores = {}
+        for v in reversed(order):
+            parts = [[rng.random()]] if v < formula_count else []
+            for d in downstream[v]:
+                if d not in placed:
+                    continue
+                parts.append(sketches[d])
+                pending[d] -= 1
+                if pending[d] == 0:
+                    del sketches[d]
+            if len(parts) == 1:
+                sketch = parts[0] #sketches are never mutated, a single contributor can be shared as is
+            else:
+                sketch = sorted(set().union(*parts))[:SKETCH_SIZE]
+            if pending[v]:
+                sketches[v] = sketch
+            if v < formula_count:
+                score = len(sketch) if len(sketch) < SKETCH_SIZE else round((SKETCH_SIZE - 1) / sketch[-1])
+                scores[self._cell_name(self.formula_nodes[v])] = score
+        return dict(sorted(scores.items(), key=lambda item: -item[1]))
+
+    def stats(self):
+        return {"sheets": len(self.sheets), "nodes": len(self._node_keys), "formulas": len(self.formula_nodes),
+                "ranges": len(self.rng_sheet), "cell_edges": len(self.cell_dst), "range_edges": len(self.range_dst)}
+
+
+def build_graph(workbook):
+    """
+    Args:
+        workbook (StreamedWorkbook): walked one sheet at a time via iter_sheets()
+
+    Returns:
+        DependencyGraph over every formula cell in the workbook
+    """
+    graph = DependencyGraph()
+    for sheet in workbook.iter_sheets():
+        for coord, cell in sheet.items():
+            if cell.formula:
+                graph.add_formula(sheet.title, coord, cell.formula)
+    return graph.finish()
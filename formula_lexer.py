@@ -0,0 +1,101 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Single-pass lexer for Excel formulas. One compiled pattern walks the formula left to right and every reference comes out
+# typed (cell / range / whole columns / whole rows / defined name / structured reference) with its sheet and $ flags, so we
+# don't need separate regex passes for cells and ranges. String literals are skipped, so text like "A1" inside quotes and
+# function names like LOG10( are never mistaken for cells. Operators, punctuation and function names are swallowed in one
+# "other" match per run, so the Python loop below only sees strings, numbers and references.
+
+Ref = namedtuple("Ref", ["kind", "sheet", "ref", "abs_flags", "span"])
+# kind: "cell" | "range" | "columns" | "rows" | "name" | "structured"
+# sheet: sheet name (quotes/'' escapes removed) or None if the ref is on the formula's own sheet
+# ref: the reference with $ stripped, e.g. "B4", "A1:C3", "A:C", "3:5", "TaxRate", "Sales[Amount]"
+# abs_flags: (start_col_abs, start_row_abs, end_col_abs, end_row_abs). Cells repeat the start flags as the end flags; names/structured refs are all False
+# span: (start, end) offsets of the whole reference (sheet prefix included) in the formula string
+
+_COL = r"\$?[A-Za-z]{1,3}"
+_ROW = r"\$?[0-9]+"
+_END = r"(?![\w.(!\[])" #a ref can't run straight into more name characters, a call paren or a sheet bang
+_NAME_START = r"(?:[^\W\d]|\\)" #any Unicode letter, _ or \, so sheets/names like Übersicht aren't cut down to "bersicht"
+
+TOKEN_PATTERN = re.compile(rf"""
+    (?P<string>"(?:[^"]|"")*")
+  | (?P<error>\#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A|GETTING_DATA|SPILL!|CALC!))
+  | (?P<other>(?:[^"\#'\[\w$.\\]|{_NAME_START}[\w.]*\()+)
+  | (?P<sref>
+        (?:
+            '(?P<qsheet>(?:[^']|'')+)'!
+          | (?P<usheet>(?:\[[^\]]+\])?{_NAME_START}[\w.]*)!
+        )?
+        (?:
+            (?P<range>{_COL}{_ROW}:{_COL}{_ROW}){_END}
+          | (?P<cell>{_COL}{_ROW}){_END}
+          | (?P<columns>{_COL}:{_COL}){_END}
+          | (?P<rows>{_ROW}:{_ROW}){_END}
+          | (?P<table>{_NAME_START}[\w.]*)?(?P<struct>\[(?:[^\[\]']|'.|\[(?:[^\[\]']|'.)*\])*\])
+          | (?P<word>{_NAME_START}[\w.?\\]*)
+        )
+    )
+  | (?P<number>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[Ee][+-]?[0-9]+)?)
+  | (?P<stray>.)
+""", re.VERBOSE | re.DOTALL)
+
+_PART = re.compile(r"(\$?)([A-Za-z]*)(\$?)([0-9]*)")
+_LITERAL_WORDS = {"TRUE", "FALSE"}
+
+
+def _parts(text):
+    """
+    "$A1" -> ("A", True, "1", False). Either the letters or the digits may be empty (whole column / whole row refs).
+    """
+    col_abs, col, row_abs, row = _PART.fullmatch(text).groups()
+    if not col: #a row-only part like "$5" puts its $ in the first group
+        return "", False, row, bool(col_abs or row_abs)
+    return col.upper(), bool(col_abs), row, bool(row_abs)
+
+
+def _area(text):
+    start, end = text.split(":")
+    start_col, start_col_abs, start_row, start_row_abs = _parts(start)
+    end_col, end_col_abs, end_row, end_row_abs = _parts(end)
+    return f"{start_col}{start_row}:{end_col}{end_row}", (start_col_abs, start_row_abs, end_col_abs, end_row_abs)
+
+
+@lru_cache(maxsize=65536)
+def extract_refs(formula):
+    """
+    Lex a formula once and return every reference in it, in order.
+
+    Memoized by formula string, so filled-down formulas and repeated calls (extract_cells + extract_ranges on the same formula) only lex once.
+
+    Args:
+        formula (str): the formula, with or without the leading "="
+
+    Returns:
+        refs (tuple): tuple of Ref
+    """
+    refs = []
+    for match in TOKEN_PATTERN.finditer(formula):
+        if match.lastgroup != "sref":
+            continue
+        qsheet, usheet, range_, cell, columns, rows, table, struct, word = match.group(
+            "qsheet", "usheet", "range", "cell", "columns", "rows", "table", "struct", "word")
+        sheet = qsheet.replace("''", "'") if qsheet else usheet
+
+        if cell:
+            col, col_abs, row, row_abs = _parts(cell)
+            refs.append(Ref("cell", sheet, f"{col}{row}", (col_abs, row_abs, col_abs, row_abs), match.span()))
+        elif range_ or columns or rows:
+            kind = "range" if range_ else "columns" if columns else "rows"
+            ref, abs_flags = _area(range_ or columns or rows)
+            refs.append(Ref(kind, sheet, ref, abs_flags, match.span()))
+        elif struct:
+            refs.append(Ref("structured", sheet, f"{table or ''}{struct}", (False,) * 4, match.span()))
+        else:
+            next_char = formula[match.end():match.end() + 1]
+            if next_char == "(" or (sheet is None and word.upper() in _LITERAL_WORDS):
+                continue #function call or TRUE/FALSE
+            refs.append(Ref("name", sheet, word, (False,) * 4, match.span()))
+    return tuple(refs)
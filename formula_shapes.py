@@ -0,0 +1,154 @@
+from collections import namedtuple
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string
+from formula_lexer import extract_refs
+
+# Filled-down / filled-across formulas only differ by their relative offsets. Rewriting every reference in relative R1C1 form
+# gives them all the same "shape" string, so an expensive check (LLM round-trip) can run once per shape and be fanned back out.
+
+ShapeGroup = namedtuple("ShapeGroup", ["shape", "cells"]) #cells in the order they were given, cells[0] is the representative
+ShapeVerdict = namedtuple("ShapeVerdict", ["result", "representative", "outlier"])
+
+_AREA_KINDS = ("cell", "range", "columns", "rows")
+
+
+def _r1c1_part(col, row, col_abs, row_abs, origin_col, origin_row):
+    text = ""
+    if row:
+        row = int(row)
+        text += f"R{row}" if row_abs else ("R" if row == origin_row else f"R[{row - origin_row}]")
+    if col:
+        col = column_index_from_string(col)
+        text += f"C{col}" if col_abs else ("C" if col == origin_col else f"C[{col - origin_col}]")
+    return text
+
+
+def to_r1c1(formula, coord):
+    """
+    Rewrite formula's cell/range refs relative to coord, e.g. "=B4*$C$1" in C4 -> "=RC[-1]*R1C3"
+
+    Args:
+        formula (str): A1-style formula
+
+        coord (str): the cell the formula lives in, e.g. "C4"
+
+    Returns:
+        r1c1 (str): the formula with every A1 reference swapped for its R1C1 form (sheet prefixes kept as written)
+    """
+    origin_col_letter, origin_row = coordinate_from_string(coord)
+    origin_col = column_index_from_string(origin_col_letter)
+
+    pieces = []
+    last = 0
+    for ref in extract_refs(formula):
+        if ref.kind not in _AREA_KINDS:
+            continue
+        start, end = ref.span
+        written = formula[start:end]
+        bang = written.rfind("!")
+        prefix = written[:bang + 1] if bang != -1 else ""
+
+        start_col_abs, start_row_abs, end_col_abs, end_row_abs = ref.abs_flags
+        parts = ref.ref.split(":")
+        first_col, first_row = _split(parts[0])
+        r1c1 = _r1c1_part(first_col, first_row, start_col_abs, start_row_abs, origin_col, origin_row)
+        if len(parts) == 2:
+            second_col, second_row = _split(parts[1])
+            r1c1 += ":" + _r1c1_part(second_col, second_row, end_col_abs, end_row_abs, origin_col, origin_row)
+
+        pieces.append(formula[last:start])
+        pieces.append(prefix + r1c1)
+        last = end
+    pieces.append(formula[last:])
+    return "".join(pieces)
+
+
+def _split(part):
+    """
+    "AB12" -> ("AB", "12"), "AB" -> ("AB", ""), "12" -> ("", "12")
+    """
+    i = 0
+    while i < len(part) and part[i].isalpha():
+        i += 1
+    return part[:i], part[i:]
+
+
+def group_by_shape(formula_cells, partition=None, shapes=None):
+    """
+    Group one sheet's formula cells by their R1C1 shape.
+
+    Args:
+        formula_cells (dict): {coord: formula} for one worksheet
+
+        partition (callable): optional coord -> key, shapes are only grouped within the same key (e.g. the table title, so the same
+        relative formula in two different tables still gets checked once per table)
+
+        shapes (dict): optional precomputed {coord: shape}
+
+    Returns:
+        groups (list): list of ShapeGroup in order of first appearance
+    """
+    groups = {}
+    for coord, formula in formula_cells.items():
+        shape = shapes[coord] if shapes is not None else to_r1c1(formula, coord)
+        key = (partition(coord) if partition else None, shape)
+        if key not in groups:
+            groups[key] = ShapeGroup(key[1], [])
+        groups[key].cells.append(coord)
+    return list(groups.values())
+
+
+def find_outliers(formula_cells, shapes=None):
+    """
+    Cells that break the pattern around them: both neighbours on the row (left + right) or both on the column (above + below)
+    share a shape that this cell doesn't. Same rule as Excel's "inconsistent formula" warning.
+
+    Args:
+        formula_cells (dict): {coord: formula} for one worksheet
+
+        shapes (dict): optional precomputed {coord: shape}
+
+    Returns:
+        outliers (set): coords that look like a broken fill
+    """
+    if shapes is None:
+        shapes = {coord: to_r1c1(formula, coord) for coord, formula in formula_cells.items()}
+
+    by_position = {}
+    for coord, shape in shapes.items():
+        col_letter, row = coordinate_from_string(coord)
+        by_position[(column_index_from_string(col_letter), row)] = shape
+
+    outliers = set()
+    for (col, row), shape in by_position.items():
+        left, right = by_position.get((col - 1, row)), by_position.get((col + 1, row))
+        above, below = by_position.get((col, row - 1)), by_position.get((col, row + 1))
+        if (left is not None and left == right and left != shape) or (above is not None and above == below and above != shape):
+            outliers.add(f"{get_column_letter(col)}{row}")
+    return outliers
+
+
+def analyze_by_shape(formula_cells, analyze, partition=None):
+    """
+    Run analyze once per shape and fan the result back out to every cell with that shape.
+
+    Args:
+        formula_cells (dict): {coord: formula} for one worksheet
+
+        analyze (callable): (coord, formula) -> result, e.g. a guess_cell_formula-style LLM check. Called with each group's first cell.
+
+        partition (callable): see group_by_shape
+
+    Returns:
+        verdicts (dict): {coord: ShapeVerdict(result, representative coord, outlier flag)}
+    """
+    shapes = {coord: to_r1c1(formula, coord) for coord, formula in formula_cells.items()}
+    outliers = find_outliers(formula_cells, shapes)
+
+    verdicts = {}
+    for group in group_by_shape(formula_cells, partition=partition, shapes=shapes):
+        representative = group.cells[0]
+        result = analyze(representative, formula_cells[representative])
+        for coord in group.cells:
+            verdicts[coord] = ShapeVerdict(result, representative, coord in outliers)
+    return verdicts
@@ -0,0 +1,91 @@
+import sys
+from openpyxl.utils import range_boundaries
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+from dependency_graph import build_graph
+from xlsx_stream import StreamedWorkbook
+
+# Incremental re-audit: diff two versions of a workbook, push the changed cells through the dependency graph (built from
+# parse.extract_cells / extract_ranges), and only re-check the formula cells that come out the other end.
+
+
+def diff_workbooks(old_path, new_path):
+    """
+    Compare two versions of a workbook cell by cell (formula text and cached value).
+
+    Walks the new version one sheet at a time and pulls the matching old sheet on demand, so at most two sheets are in memory.
+
+    Returns:
+        changed (dict): {ws_title: set(coords)} for cells that were added, removed, or whose formula/value differs. A sheet that
+        only exists in one version has all of its cells listed.
+    """
+    old_wb = StreamedWorkbook(old_path, max_sheets=1)
+    new_wb = StreamedWorkbook(new_path)
+    old_titles = set(old_wb.sheetnames)
+
+    changed = {}
+    for new_sheet in new_wb.iter_sheets():
+        old_sheet = old_wb[new_sheet.title] if new_sheet.title in old_titles else {}
+        sheet_changes = {coord for coord, cell in new_sheet.items()
+                         if coord not in old_sheet or old_sheet[coord].formula != cell.formula or old_sheet[coord].value != cell.value}
+        sheet_changes.update(coord for coord in old_sheet if coord not in new_sheet)
+        if sheet_changes:
+            changed[new_sheet.title] = sheet_changes
+
+    for removed in old_titles - set(new_wb.sheetnames):
+        changed[removed] = set(old_wb[removed])
+    return changed
+
+
+def _in_bounds(col, row, bounds):
+    min_col, min_row, max_col, max_row = bounds
+    return ((min_col is None or min_col <= col <= max_col) and (min_row is None or min_row <= row <= max_row))
+
+
+def affected_cells(workbook, changed, graph=None):
+    """
+    Everything that has to be re-checked after an edit: the changed cells plus every formula that depends on them, transitively.
+
+    Args:
+        workbook (StreamedWorkbook): the new version
+
+        changed (dict): {ws_title: set(coords)} from diff_workbooks
+
+        graph (DependencyGraph): optional, already built for the new version (otherwise it's built here)
+
+    Returns:
+        affected (set): {(ws_title, coord)} formula cells (and changed cells) whose check could come out differently
+    """
+    if graph is None:
+        graph = build_graph(workbook)
+    changed_keys = {(ws_title, coord) for ws_title, coords in changed.items() for coord in coords}
+    return changed_keys | graph.transitive_dependents(changed_keys)
+
+
+def map_is_stale(workbook_map, changed):
+    """
+    True if an edit touched a header cell (col_descriptors / row_descriptors), i.e. the semantic map itself has to be rebuilt
+    and every cell it describes re-checked, not just the edited formulas.
+    """
+    for worksheet in workbook_map["worksheets"]:
+        coords = changed.get(worksheet["ws_title"])
+        if not coords:
+            continue
+        for table in worksheet["tables"]:
+            for descriptors in (table["col_descriptors"], table["row_descriptors"]):
+                bounds = range_boundaries(descriptors)
+                for coord in coords:
+                    col_letter, row = coordinate_from_string(coord)
+                    if _in_bounds(column_index_from_string(col_letter), row, bounds):
+                        return True
+    return False
+
+
+if __name__ == "__main__":
+    # python incremental.py old.xlsm new.xlsm
+    old_path, new_path = sys.argv[1], sys.argv[2]
+    changed = diff_workbooks(old_path, new_path)
+    print(f"{sum(len(coords) for coords in changed.values())} cells changed across {len(changed)} sheets")
+    affected = affected_cells(StreamedWorkbook(new_path, max_sheets=1), changed)
+    print(f"{len(affected)} cells to re-check")
+    for ws_title, coord in sorted(affected):
+        print(f"  '{ws_title}'!{coord}")
@@ -0,0 +1,195 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Process-wide timers and counters for the audit pipeline, so a slow run shows where the time went (workbook load, semantic
+# mapping, reference extraction, prompt construction, model latency) instead of us guessing from print output.
+#
+#   with instrument.stage("semantic_map"):     # wall time per stage, nested stages show up nested in the trace
+#       ...
+#   instrument.count("lookup_misses")          # plain counters
+#
+#   instrument.configure(profile={"semantic_map"}, memory={"semantic_map"})  # cProfile / tracemalloc for chosen stages
+#   instrument.start_live()                    # one-line running summary on stderr
+#   instrument.export("trace.json")            # Chrome trace format (chrome://tracing or ui.perfetto.dev), with totals + counters
+#
+# Always on: a stage costs a couple of perf_counter calls, a counter is a dict increment. Per-call trace events stop after
+# MAX_EVENTS so instrumenting hot paths can't eat memory on huge workbooks (totals keep counting).
+
+MAX_EVENTS = 200_000
+
+counters = defaultdict(int)
+stages = {} #{name: {"calls", "seconds", "max_seconds"}}
+profiles = {} #{name: pstats text} for stages listed in configure(profile=...)
+memory_peaks = {} #{name: peak KB} for stages listed in configure(memory=...)
+
+_events = []
+_origin = time.perf_counter()
+_profile_stages = set()
+_memory_stages = set()
+_profile_active = False #only one cProfile can run at a time
+_live_thread = None
+_live_stream = sys.stderr
+_live_stop = threading.Event()
+
+
+def configure(profile=(), memory=()):
+    """
+    Args:
+        profile (iterable): stage names to run under cProfile (cumulative stats kept in profiles[name])
+
+        memory (iterable): stage names to run under tracemalloc (peak kept in memory_peaks[name])
+    """
+    _profile_stages.clear()
+    _profile_stages.update(profile)
+    _memory_stages.clear()
+    _memory_stages.update(memory)
+
+
+def reset():
+    counters.clear()
+    stages.clear()
+    profiles.clear()
+    memory_peaks.clear()
+    _events.clear()
+
+
+def count(name, n=1):
+    counters[name] += n
+
+
+def _record(name, start, elapsed):
+    totals = stages.get(name)
+    if totals is None:
+        totals = stages[name] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+    totals["calls"] += 1
+    totals["seconds"] += elapsed
+    if elapsed > totals["max_seconds"]:
+        totals["max_seconds"] = elapsed
+    if len(_events) < MAX_EVENTS:
+        _events.append((name, start, elapsed, threading.get_ident()))
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the block as one call of stage name. Works across awaits too (wall time, so overlapping async calls each count in full).
+    """
+    global _profile_active
+    profiler = None
+    if name in _profile_stages and not _profile_active:
+        profiler = cProfile.Profile()
+        _profile_active = True
+    tracing = name in _memory_stages and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+            _profile_active = False
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(30)
+            profiles[name] = text.getvalue()
+        if tracing:
+            memory_peaks[name] = max(memory_peaks.get(name, 0), tracemalloc.get_traced_memory()[1] >> 10)
+            tracemalloc.stop()
+        _record(name, start, elapsed)
+
+
+def timed(name):
+    """
+    Decorator version of stage().
+    """
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        inner.__name__, inner.__doc__ = fn.__name__, fn.__doc__
+        return inner
+    return wrap
+
+
+def summary():
+    """
+    Returns:
+        text (str): one line per stage (slowest first) then the counters
+    """
+    lines = [f"{'stage':<28}{'calls':>9}{'total s':>11}{'mean ms':>11}{'max ms':>11}"]
+    for name, totals in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+        mean = totals["seconds"] / totals["calls"] * 1000
+        lines.append(f"{name:<28}{totals['calls']:>9}{totals['seconds']:>11.3f}{mean:>11.3f}{totals['max_seconds'] * 1000:>11.3f}")
+    for name, peak in memory_peaks.items():
+        lines.append(f"{name:<28} peak memory {peak} KB")
+    if counters:
+        lines.append(", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+    return "\n".join(lines)
+
+
+def export(path):
+    """
+    Write a Chrome trace (traceEvents) plus the stage totals, counters, memory peaks and cProfile output to path.
+    """
+    pid = os.getpid()
+    trace = {
+        "traceEvents": [{"name": name, "ph": "X", "ts": (start - _origin) * 1e6, "dur": elapsed * 1e6, "pid": pid, "tid": tid}
+                        for name, start, elapsed, tid in _events],
+        "displayTimeUnit": "ms",
+        "stages": stages,
+        "counters": dict(counters),
+        "memory_peaks_kb": memory_peaks,
+        "profiles": profiles,
+        "events_dropped": max(sum(totals["calls"] for totals in stages.values()) - len(_events), 0),
+    }
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(trace, f)
+
+
+def _live_line():
+    busiest = sorted(list(stages.items()), key=lambda item: -item[1]["seconds"])[:4]
+    parts = [f"{name} {totals['seconds']:.1f}s/{totals['calls']}" for name, totals in busiest]
+    parts += [f"{name}={counters[name]}" for name in ("cells_mapped", "lookup_misses", "prompt_tokens") if name in counters]
+    return " | ".join(parts)
+
+
+def start_live(interval=2.0, stream=sys.stderr):
+    """
+    Rewrite a one-line summary on stream every interval seconds until stop_live().
+    """
+    global _live_thread, _live_stream
+    if _live_thread:
+        return
+    _live_stream = stream
+    _live_stop.clear()
+
+    def loop():
+        while not _live_stop.wait(interval):
+            stream.write(f"\r[instrument] {_live_line()}\033[K")
+            stream.flush()
+
+    _live_thread = threading.Thread(target=loop, daemon=True)
+    _live_thread.start()
+
+
+def stop_live():
+    global _live_thread
+    if _live_thread:
+        _live_stop.set()
+        _live_thread.join()
+        _live_thread = None
+        _live_stream.write("\n")
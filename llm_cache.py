@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+# SQLite cache of chat completions, keyed by model + a hash of the normalized conversation. Re-auditing an unchanged
+# workbook asks the exact same questions, so repeat runs are answered from here without touching the API.
+
+DEFAULT_PATH = os.path.join(".maestro_cache", "llm_cache.sqlite")
+DEFAULT_TTL = 30 * 24 * 3600 #seconds
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def prompt_key(model, messages):
+    """
+    Returns:
+        key (str): sha256 of the model + the messages with whitespace collapsed, so re-indented prompts still hit
+    """
+    normalized = [{"role": m["role"], "content": _WHITESPACE.sub(" ", m["content"]).strip()} for m in messages]
+    return hashlib.sha256(json.dumps([model, normalized], separators=(",", ":")).encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Args:
+        path (str): sqlite file, created if missing
+
+        max_entries (int): once over this, the least recently used entries are dropped
+
+        ttl (float): seconds an answer stays valid, None to keep forever
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=100_000, ttl=DEFAULT_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, model, messages):
+        """
+        Returns:
+            content (str) of the cached completion, or None on a miss / expired entry
+        """
+        key = prompt_key(model, messages)
+        row = self._conn.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        content, created = row
+        if self.ttl is not None and now - created > self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.stats["hits"] += 1
+        return content
+
+    def put(self, model, messages, content):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, content, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (prompt_key(model, messages), model, content, now, now))
+        self._conn.commit()
+        self.stats["writes"] += 1
+        if self.stats["writes"] % 100 == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Drop expired entries, then the least recently used ones until we're back under max_entries.
+        """
+        removed = 0
+        if self.ttl is not None:
+            removed += self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)).rowcount
+        self._conn.commit()
+        self.stats["evictions"] += removed
+        return removed
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def close(self):
+        self.evict()
+        self._conn.close()
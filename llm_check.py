@@ -0,0 +1,214 @@
+import asyncio
+import random
+import re
+import sys
+import time
+from collections import namedtuple
+import openai
+from parse import estimate_tokens
+import instrument
+
+# Async engine for the guess-then-evaluate formula check (what guess_cell_formula in main.py does, one cell at a time).
+# Runs many checks at once under a concurrency cap and a tokens-per-minute budget, retries transient API errors with
+# backoff, and hands results back in the same order the requests came in.
+
+CheckRequest = namedtuple("CheckRequest", ["ws", "cell", "formula", "prompt", "context"]) #context is parse.formula_context output shown with the real formula, can be ""
+CheckResult = namedtuple("CheckResult", ["verdict", "reasoning", "error"]) #verdict is "Y", "N" or "Unknown"; error is set (and verdict "Unknown") if every retry failed
+
+DEFAULT_MODEL = "gpt-4o"
+COMPLETION_TOKEN_ESTIMATE = 300 #budgeted per call before we know the real usage
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+EVALUATION_PROMPT = "The employee has attempted to write the formula, they wrote: {formula}\n\n{context}\n\nDoes the employee's formula match with yours? If it doesn't match, why might that be? Does it need to be fixed? Respond YES it's fine to leave as is. or NO it needs to be fixed. Format you response as [Y] or [N]"
+
+
+class EmptyCompletionError(Exception):
+    """
+    The model answered without any text (content filter, refusal, ...). Not retried and never cached, the check just comes back Unknown.
+    """
+
+
+def parse_verdict(evaluation):
+    match = re.search(r'\[(Y|N)\]', evaluation)
+    return match.group(1) if match else "Unknown"
+
+
+class TokenRateLimiter:
+    """
+    Token bucket for a tokens-per-minute budget. acquire() waits until the estimated tokens fit, settle() corrects the bucket
+    once the real usage comes back.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.capacity) #a single oversized request still has to go through eventually
+        async with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+    def settle(self, estimated, actual):
+        self.tokens = min(self.capacity, self.tokens + estimated - actual)
+
+
+def print_progress(done, total):
+    sys.stdout.write(f"\rchecked {done}/{total}")
+    if done == total:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
+async def _complete(client, messages, model, limiter, max_retries, backoff, cache=None):
+    """
+    One chat completion with rate limiting and retries. Answered from cache (llm_cache.LLMCache) when we've asked this exact thing before.
+
+    Returns:
+        content (str)
+
+    Raises:
+        EmptyCompletionError: the completion had no message content
+    """
+    if cache:
+        content = cache.get(model, messages)
+        if content is not None:
+            instrument.count("llm_cache_hits")
+            return content
+
+    estimated = estimate_tokens("".join(m["content"] for m in messages)) + COMPLETION_TOKEN_ESTIMATE
+    for attempt in range(max_retries + 1):
+        if limiter:
+            with instrument.stage("llm_rate_limit_wait"):
+                await limiter.acquire(estimated)
+        try:
+            with instrument.stage("llm_call"):
+                completion = await client.chat.completions.create(model=model, messages=messages)
+        except RETRYABLE_ERRORS:
+            instrument.count("llm_retries")
+            if limiter:
+                limiter.settle(estimated, 0)
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff)) #exponential backoff with jitter
+            continue
+        instrument.count("llm_calls")
+        if completion.usage:
+            instrument.count("prompt_tokens", completion.usage.prompt_tokens)
+            instrument.count("completion_tokens", completion.usage.completion_tokens)
+        if limiter and completion.usage:
+            limiter.settle(estimated, completion.usage.total_tokens)
+        content = completion.choices[0].message.content if completion.choices else None
+        if content is None:
+            finish_reason = completion.choices[0].finish_reason if completion.choices else "no choices"
+            raise EmptyCompletionError(f"model returned no content (finish_reason: {finish_reason})")
+        if cache:
+            cache.put(model, messages, content)
+        return content
+
+
+async def check_cell(client, request, model=DEFAULT_MODEL, limiter=None, max_retries=5, backoff=1.0, cache=None):
+    """
+    Guess-then-evaluate for one cell: ask the model what the formula should be, then show it the real formula and ask for [Y]/[N].
+
+    Returns:
+        CheckResult
+    """
+    messages = [{"role": "user", "content": request.prompt}]
+    try:
+        ai_guess = await _complete(client, messages, model, limiter, max_retries, backoff, cache)
+        messages.append({"role": "assistant", "content": ai_guess})
+        messages.append({"role": "user", "content": EVALUATION_PROMPT.format(formula=request.formula, context=f"Here is what the formula refers to:\n{request.context}" if request.context else "")})
+        evaluation = await _complete(client, messages, model, limiter, max_retries, backoff, cache)
+    except (openai.OpenAIError, EmptyCompletionError) as e:
+        return CheckResult("Unknown", "", f"{type(e).__name__}: {e}")
+
+    verdict = parse_verdict(evaluation)
+    reasoning = f"AI GUESS: {ai_guess}\n\n EVALUATION: {evaluation}\n\nVERDICT: {verdict}\n\nPROMPT: {request.prompt}"
+    return CheckResult(verdict, reasoning, None)
+
+
+async def run_checks(requests, client, model=DEFAULT_MODEL, concurrency=8, tokens_per_minute=None, max_retries=5, backoff=1.0, progress=print_progress, cache=None, on_result=None, semaphore=None, limiter=None):
+    """
+    Run check_cell over every request concurrently.
+
+    Args:
+        requests (list): list of CheckRequest
+
+        client (openai.AsyncOpenAI): any OpenAI-compatible async client (point base_url at stub_llm_server.py for local testing).
+        Build it with max_retries=0, retries are handled here.
+
+        concurrency (int): max checks in flight at once
+
+        tokens_per_minute (int): optional TPM budget shared by every call, None for no limit
+
+        max_retries (int): retries per API call on rate limits / connection errors / 5xx
+
+        backoff (float): base seconds for exponential backoff
+
+        progress (callable): (done, total) after each finished check, None to stay quiet
+
+        cache (llm_cache.LLMCache): optional response cache, hits skip the API (and the rate limiter) entirely
+
+        on_result (callable): (index, CheckResult) as soon as each check finishes, e.g. to journal it before the rest are done
+
+        semaphore (asyncio.Semaphore), limiter (TokenRateLimiter): pass the same ones to several concurrent run_checks calls to
+        share one concurrency / TPM budget between them (batch_audit.py). When given, concurrency / tokens_per_minute are ignored.
+
+    Returns:
+        results (list): CheckResult for each request, same order as requests
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(concurrency)
+    if limiter is None and tokens_per_minute:
+        limiter = TokenRateLimiter(tokens_per_minute)
+    results = [None] * len(requests)
+    done = 0
+
+    async def worker(i, request):
+        nonlocal done
+        async with semaphore:
+            results[i] = await check_cell(client, request, model=model, limiter=limiter, max_retries=max_retries, backoff=backoff, cache=cache)
+        if on_result:
+            on_result(i, results[i])
+        done += 1
+        if progress:
+            progress(done, len(requests))
+
+    await asyncio.gather(*(worker(i, request) for i, request in enumerate(requests)))
+    return results
+
+
+def check_cells(requests, client_kwargs=None, **engine_kwargs):
+    """
+    Blocking wrapper around run_checks for scripts like main.py.
+
+    Args:
+        requests (list): list of CheckRequest
+
+        client_kwargs (dict): passed to openai.AsyncOpenAI (api_key, base_url, ...)
+
+        **engine_kwargs: passed to run_checks
+
+    Returns:
+        results (list): CheckResult per request, same order
+    """
+    async def go():
+        client = openai.AsyncOpenAI(max_retries=0, **(client_kwargs or {}))
+        try:
+            return await run_checks(requests, client, **engine_kwargs)
+        finally:
+            await client.close()
+    return asyncio.run(go())
@@ -9,25 +9,87 @@ import os
 import json
 import semantic_map
 import parse
-
-# Load the workbook_map.json file
-with open('workbook_map.json', 'r') as f:
-    workbook_map = json.load(f)
-
-cell_lookup = semantic_map.semantic_map_workbook(workbook_map) #note this implicitly has the name of the spreadsheet in the workbook_map which tells semantic map to load that workbook from root.
-
-# Load the workbook
-formulas_wb = load_workbook('kc_big.xlsm', data_only=False)
-values_wb = load_workbook('kc_big.xlsm', data_only=True)
-
-
-# Save the result to test.json
-with open('test.json', 'w') as f:
-    json.dump(cell_lookup, f, indent=4)
-
-print("Results saved to test.json")
-
-print("CONTEXT FOR LLM\n", parse.formula_context(formula ="""=IFERROR(INDEX(XLOOKUP($C65,'Master Coverage Ratios'!$I$24:$AD$24,'Master Coverage Ratios'!$I$27:$AD$61),MATCH(H$59,'Master Coverage Ratios'!$B$27:$B$61,0,$C65:$C$66)),"Unavailable")""",formula_ws = "S9-13, 29-36 | Ratio Summaries",cell_lookup = cell_lookup, values_wb = values_wb))
+import map_cache
+import audit
+import annotations
+import incremental
+import instrument
+from llm_cache import LLMCache
+from workbook_session import WorkbookSession
+from value_index import ValueProvider
+
+if __name__ == "__main__": #MAESTRO_WORKERS > 1 starts process pools, which re-import this module under spawn (macOS / Windows)
+    # Load the workbook_map.json file
+    with open('workbook_map.json', 'r') as f:
+        workbook_map = json.load(f)
+
+    # Instrumentation (instrument.py): MAESTRO_PROFILE=semantic_map_sheet,llm_checks runs those stages under cProfile, MAESTRO_PROFILE_MEMORY=... under tracemalloc,
+    # MAESTRO_LIVE=1 keeps a running summary on stderr, MAESTRO_TRACE=trace.json saves a Chrome trace of the run
+    instrument.configure(profile=filter(None, os.getenv("MAESTRO_PROFILE", "").split(",")), memory=filter(None, os.getenv("MAESTRO_PROFILE_MEMORY", "").split(",")))
+    if os.getenv("MAESTRO_LIVE"):
+        instrument.start_live()
+
+    session = WorkbookSession(streaming=True, max_sheets=int(os.getenv("MAESTRO_MAX_SHEETS", "2"))) #every workbook read goes through here; only the last couple of parsed sheets stay in memory
+
+    workers = int(os.getenv("MAESTRO_WORKERS", "1")) #>1 maps worksheets and builds the audit prompts in a process pool
+    with instrument.stage("load_semantic_map"):
+        cell_lookup, cache_hit = map_cache.load_semantic_map(workbook_map, session=session, workers=workers) #note this implicitly has the name of the spreadsheet in the workbook_map which tells semantic map to load that workbook from root. Cached on disk, keyed by the workbook bytes + map config.
+    print("Semantic map loaded from cache" if cache_hit else "Semantic map built (and cached)")
+
+    # Load the workbook (lazily, nothing is read until something needs a sheet). Streamed, so this is one object with both formulas (wb[ws][cell].formula) and cached values (wb[ws][cell].value),
+    # and it's the same object semantic_map already read its headers from.
+    formulas_wb = session.get_workbook(workbook_map["wb_title"], data_only=False)
+    # Value fallbacks in cell_to_context only need a handful of cells, so they're read from an on-disk index (.maestro_cache/values-*.sqlite) instead of keeping whole sheets in memory
+    values_wb = ValueProvider(workbook_map["wb_title"])
+    print("Workbook session stats:", session.stats)
+
+
+    print("CONTEXT FOR LLM\n", parse.formula_context(formula ="""=IFERROR(INDEX(XLOOKUP($C65,'Master Coverage Ratios'!$I$24:$AD$24,'Master Coverage Ratios'!$I$27:$AD$61),MATCH(H$59,'Master Coverage Ratios'!$B$27:$B$61,0,$C65:$C$66)),"Unavailable")""",formula_ws = "S9-13, 29-36 | Ratio Summaries",cell_lookup = cell_lookup, values_wb = values_wb))
+
+    # Full audit of every check_cell_range. Set MAESTRO_AUDIT=1 plus OPENAI_API_KEY (or OPENAI_BASE_URL=http://127.0.0.1:8765/v1 with stub_llm_server.py running)
+    load_dotenv()
+    if os.getenv("MAESTRO_AUDIT"):
+        tokens_per_minute = os.getenv("MAESTRO_TPM")
+        llm_cache = None if os.getenv("MAESTRO_NO_LLM_CACHE") else LLMCache() #repeat runs on an unchanged workbook are answered from .maestro_cache/llm_cache.sqlite
+
+        only = None
+        baseline_path = os.getenv("MAESTRO_BASELINE") #previous version of the workbook, only re-check what the edit could have affected
+        if baseline_path:
+            changed = incremental.diff_workbooks(baseline_path, workbook_map["wb_title"])
+            if incremental.map_is_stale(workbook_map, changed):
+                print("Incremental: header cells changed, re-checking everything")
+            else:
+                only = incremental.affected_cells(formulas_wb, changed)
+                print(f"Incremental: {sum(len(c) for c in changed.values())} cells changed, {len(only)} affected")
+
+        sink = annotations.AnnotationSink(annotations.journal_path(workbook_map)) #picks up a crashed run's verdicts instead of re-asking
+        verdicts = audit.audit_workbook(workbook_map, cell_lookup, formulas_wb, only=only, sink=sink,
+                                        concurrency=int(os.getenv("MAESTRO_CONCURRENCY", "8")),
+                                        tokens_per_minute=int(tokens_per_minute) if tokens_per_minute else None,
+                                        cache=llm_cache, workers=workers, values_wb=values_wb)
+
+        report_path = os.getenv("MAESTRO_REPORT") #.json or .csv sidecar, leaves the workbook alone
+        if report_path:
+            sink.write_report(report_path)
+            print(f"Report saved to {report_path}")
+        annotated_path = os.getenv("MAESTRO_ANNOTATE") #e.g. output.xlsm, comments + fills on every checked cell, saved once
+        if annotated_path:
+            sink.write_workbook(workbook_map["wb_title"], annotated_path)
+            print(f"Annotated workbook saved to {annotated_path}")
+        sink.close() #outputs are on disk, the journal can go
+        if llm_cache:
+            print(f"LLM cache: {llm_cache.stats} (hit rate {llm_cache.hit_rate():.0%})")
+            llm_cache.close()
+        flagged = sorted(f"'{ws}'!{cell}" for (ws, cell), v in verdicts.items() if v.result.verdict != "Y" or v.outlier)
+        print(f"Audit done: {len(verdicts)} cells checked, {len(flagged)} flagged (N / Unknown / pattern outlier)")
+        for ref in flagged:
+            print("  ", ref)
+
+    instrument.stop_live()
+    print(instrument.summary())
+    if os.getenv("MAESTRO_TRACE"):
+        instrument.export(os.getenv("MAESTRO_TRACE"))
+        print(f"Trace saved to {os.getenv('MAESTRO_TRACE')}")
 
 
 
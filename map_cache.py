@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import pickle
+import semantic_map
+import parallel
+from workbook_session import default_session
+
+# On-disk cache of semantic_map_workbook's output. The key is a hash of the workbook bytes plus the workbook_map.json config,
+# so a hit means nothing that feeds the map has changed and we can skip opening the workbook entirely.
+
+CACHE_DIR = ".maestro_cache"
+CACHE_VERSION = "1" #bump whenever the pickled SheetIndex/TableRegion layout changes
+
+
+def workbook_digest(path, chunk_size=1 << 20):
+    """
+    sha256 of the workbook file's bytes (read in chunks so 50+ MB models don't get pulled into memory at once)
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(workbook_map):
+    """
+    Returns:
+        key (str): hash of the workbook bytes + the map config. Any edit to either gives a new key.
+    """
+    digest = hashlib.sha256()
+    digest.update(CACHE_VERSION.encode())
+    digest.update(workbook_digest(workbook_map["wb_title"]).encode())
+    digest.update(json.dumps(workbook_map, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_semantic_map(workbook_map, session=default_session, cache_dir=CACHE_DIR, workers=None):
+    """
+    Same result as semantic_map.semantic_map_workbook(workbook_map), but read from cache_dir when the workbook and config are unchanged.
+
+    Args:
+        workbook_map (dict): contents of workbook_map.json
+
+        session (WorkbookSession): only used on a cache miss
+
+        cache_dir (str): where the cache files live
+
+        workers (int): on a miss, build the map with parallel.semantic_map_workbook_parallel over this many processes (None/1 builds it in-process)
+
+    Returns:
+        (cell_lookup, hit): cell_lookup is {ws_title: SheetIndex}, hit is True if it came from disk
+    """
+    key = cache_key(workbook_map)
+    cache_path = os.path.join(cache_dir, f"semantic_map-{key}.pkl")
+
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f), True
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+        print(f"MAP_CACHE: ignoring unreadable cache file {cache_path}: {e}")
+
+    if workers and workers > 1:
+        cell_lookup = parallel.semantic_map_workbook_parallel(workbook_map, workers=workers)
+    else:
+        cell_lookup = semantic_map.semantic_map_workbook(workbook_map, session=session)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(cell_lookup, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path) #so a crash mid-write never leaves a half-written cache file behind
+
+    return cell_lookup, False
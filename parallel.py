@@ -0,0 +1,89 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import parse
+import semantic_map
+from workbook_session import WorkbookSession
+
+# Process-pool versions of semantic_map_workbook and the formula-context loop. Worksheets are independent, so each one goes
+# to a worker. Workers open the workbook with the streaming reader, which only parses the sheets a worker actually touches,
+# never the whole workbook, and read the formula contexts' value fallbacks from value_index's on-disk index.
+
+_worker_session = None #one per worker process, so sheets parsed for one task are reused by the next
+_worker_cell_lookup = None
+_worker_values = {} #{workbook path: ValueProvider} for the formula contexts' value fallbacks
+
+
+def _init_worker(cell_lookup=None):
+    global _worker_session, _worker_cell_lookup
+    _worker_session = WorkbookSession(streaming=True, max_sheets=2) #mapping only reads a worker's own sheet
+    _worker_cell_lookup = cell_lookup
+
+
+def _map_sheet(workbook_path, worksheet):
+    sheet_index = semantic_map.SheetIndex(worksheet["ws_title"])
+    for table in worksheet["tables"]:
+        table_dic = {
+            "workbook": workbook_path,
+            "worksheet": worksheet["ws_title"],
+            "table_title": table["title"],
+            "col_descriptors": table["col_descriptors"],
+            "row_descriptors": table["row_descriptors"],
+            "check_cell_range": table["check_cell_range"]
+        }
+        semantic_map.semantic_map_table(table_dic, sheet_index, session=_worker_session)
+    return sheet_index
+
+
+def _sheet_contexts(workbook_path, ws_title, formulas, compact):
+    if workbook_path not in _worker_values: #fallbacks jump between sheets, so they go through the shared on-disk value index
+        from value_index import ValueProvider #value_index imports map_cache, which imports this module
+        _worker_values[workbook_path] = ValueProvider(workbook_path)
+    values = _worker_values[workbook_path]
+    return {coord: parse.formula_context(formula, ws_title, _worker_cell_lookup, values, compact=compact) for coord, formula in formulas.items()}
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def semantic_map_workbook_parallel(workbook_map, workers=None):
+    """
+    Same result as semantic_map.semantic_map_workbook, with one task per worksheet spread over a process pool.
+
+    Args:
+        workbook_map (dict): contents of workbook_map.json
+
+        workers (int): pool size, defaults to the number of cores
+
+    Returns:
+        workbook_tree (dict): {ws_title: SheetIndex}, in workbook_map order
+    """
+    worksheets = workbook_map["worksheets"]
+    with ProcessPoolExecutor(max_workers=min(workers or default_workers(), max(len(worksheets), 1)), initializer=_init_worker) as pool:
+        futures = [pool.submit(_map_sheet, workbook_map["wb_title"], worksheet) for worksheet in worksheets]
+        return {worksheet["ws_title"]: future.result() for worksheet, future in zip(worksheets, futures)}
+
+
+def formula_contexts_parallel(workbook_path, cell_lookup, formulas, workers=None, compact=False):
+    """
+    parse.formula_context for the given formula cells, one task per sheet. audit.plan_audit uses it for the shape
+    representatives when it's given more than one worker.
+
+    Args:
+        workbook_path (str): .xlsx/.xlsm
+
+        cell_lookup (dict): {ws_title: SheetIndex}, shipped to each worker once (it's table-level, so small)
+
+        formulas (dict): {ws_title: {coord: formula}} to describe
+
+        workers (int): pool size, defaults to the number of cores
+
+        compact (bool): see parse.range_to_context
+
+    Returns:
+        contexts (dict): {ws_title: {coord: context}}
+    """
+    ws_titles = [ws_title for ws_title, sheet_formulas in formulas.items() if sheet_formulas]
+    with ProcessPoolExecutor(max_workers=min(workers or default_workers(), max(len(ws_titles), 1)), initializer=_init_worker, initargs=(cell_lookup,)) as pool:
+        futures = [pool.submit(_sheet_contexts, workbook_path, ws_title, formulas[ws_title], compact) for ws_title in ws_titles]
+        return {ws_title: future.result() for ws_title, future in zip(ws_titles, futures)}
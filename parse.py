@@ -1,6 +1,8 @@
 import traceback
 import re
 from openpyxl.utils import range_boundaries, get_column_letter, column_index_from_string
+from formula_lexer import extract_refs
+import instrument
 
 # CELLS
 def extract_cells(formula):
@@ -14,18 +16,10 @@ def extract_cells(formula):
         cel_refs: A list of tuples, each containing ("worksheet", "B4"). If no worksheet (cell is on current sheet), returns ("no_sheet_referenced", "B4")
     """
 
-    range_pattern = r"[A-Z$]+\d+:[A-Z$]+\d+" #parsing ranges got too hard simpler to just kill them. It makes the formula a bit messy — could dial this in more if needed. But fine for cell extraction
-    formula_without_ranges = re.sub(range_pattern, '', formula)
-
-    cell_pattern = r"(?:(?:'([^']+)'!))?\s*(?<!:)(\$?[A-Z]+\$?\d+)(?!:)"
-
-    matches = re.findall(cell_pattern, formula_without_ranges)
-
     cell_refs = []
-    for sheet, cell in matches:
-        sheet = sheet if sheet else "no_sheet_referenced"
-        cell = re.sub(r'\$', '', cell)
-        cell_refs.append((sheet, cell))
+    for ref in extract_refs(formula): #one memoized lex per formula, ranges come out as their own kind so there's nothing to strip first
+        if ref.kind == "cell":
+            cell_refs.append((ref.sheet or "no_sheet_referenced", ref.ref))
     return cell_refs
 
 formula = """=IFERROR(INDEX(XLOOKUP($C65,'Master Coverage Ratios'!$I$24:$AD$24,'Master Coverage Ratios'!$I$27:$AD$61),MATCH(H$59,'Master Coverage Ratios'!$B$27:$B$61,0,$C65:$C$66)),"Unavailable")"""
@@ -43,7 +37,7 @@ def cell_to_context(cell, cell_ws, formula_ws, cell_lookup, values_wb):
         
         formula_ws (str): the title of the worksheet that the formula we are looking at is in. If the cell is no_sheet_referenced then we know that we should use the formula_ws to query it in cell_lookup
 
-        cell_lookup(dict): A dict of worksheets, where each worksheet key corresponds to a dict of cell lookups. e.g. {"wksht1":{"B4":{stuff},"B3":{stuff}},"wksht2"...} see test.json for example.
+        cell_lookup(dict): A dict of worksheets, where each worksheet key corresponds to a dict of cell lookups. e.g. {"wksht1":{"B4":{stuff},"B3":{stuff}},"wksht2"...} Each worksheet is a semantic_map.SheetIndex, which answers cell lookups from its tables' bounds + headers.
     
     Returns:
         context (str): a string that describes the context of the cell (for use in prompt)
@@ -58,15 +52,19 @@ def cell_to_context(cell, cell_ws, formula_ws, cell_lookup, values_wb):
     try:
         cell_data = cell_lookup[cell_ws][cell]
         context = f"*{prefix}{cell}* points to row: '{cell_data['row_descrip']}' in col: '{cell_data['col_descrip']}' in table: '{cell_data['title']}'"
+        instrument.count("lookup_hits")
 
     except KeyError:
+        instrument.count("lookup_misses")
 
         try:
             cell_data = values_wb[cell_ws][cell].value            
 
             context = f"*{prefix}{cell}* holds the value: {'[THIS CELL IS EMPTY]' if cell_data is None else cell_data}"
+            instrument.count("value_fallbacks")
 
         except KeyError:
+            instrument.count("value_fallback_errors")
             print(f"ERROR. could not find *{cell}* in cell_lookup or in values_wb. Not good. Returning nothing.")
                 
             context = ""
@@ -82,20 +80,107 @@ def extract_ranges(formula):
         formula (str): the formula in the cell
 
     Returns
-        range_refs (list): a list of all the range refs. Each range ref is a tuple which has worksheet ('worksheet', range)
+        range_refs (list): a list of all the range refs. Each range ref is a tuple which has worksheet ('worksheet', range). Whole column/row refs come through as ('worksheet', 'A:C') / ('worksheet', '3:5')
     
     """
-    range_pattern = r"(?:(?:'([^']+)'!))?\s*(\$?[A-Z]+\$?\d+:\$?[A-Z]+\$?\d+)"
-    matches = re.findall(range_pattern, formula)
-    
     range_refs = []
-    for sheet, range_ref in matches:
-        sheet = sheet if sheet else "no_sheet_referenced"
-        range_ref = re.sub(r'\$', '', range_ref)
-        range_refs.append((sheet, range_ref))
+    for ref in extract_refs(formula):
+        if ref.kind in ("range", "columns", "rows"):
+            range_refs.append((ref.sheet or "no_sheet_referenced", ref.ref))
     return range_refs
 
-def range_to_context(range_str, range_ws, formula_ws, cell_lookup):
+# RANGE SUMMARIES
+DEFAULT_RANGE_TOKENS = 200 #token budget for one compact range summary
+MIN_RUN = 3 #fewer headers than this are listed one by one, two values alone don't make a sequence
+range_context_stats = {"summaries": 0, "cache_hits": 0, "full_tokens": 0, "compact_tokens": 0, "tokens_saved": 0}
+_range_summary_cache = {} #{(id(sheet lookup), range_ws, prefix, range_str, max_tokens): (sheet lookup, context)}, the sheet lookup is kept so its id can't be reused
+
+_NUMBERED = re.compile(r"^(.*?)((?:(?<![A-Za-z0-9])-)?\d+)$") #a - straight after a letter/digit is a separator (2024-01, Scenario-1), not a sign
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (~4 characters per token), good enough for budgeting without pulling in a tokenizer.
+    """
+    return len(text) // 4 + 1
+
+
+def clear_range_summary_cache():
+    _range_summary_cache.clear()
+
+
+def _step(previous, value):
+    """
+    How value follows previous: ("same",), ("num", step) for numbers, ("text", prefix, step) for "Cluster 27" -> "Cluster 28", or None
+    """
+    if previous == value:
+        return ("same",)
+    if isinstance(previous, (int, float)) and isinstance(value, (int, float)) and not isinstance(previous, bool) and not isinstance(value, bool):
+        return ("num", value - previous)
+    if isinstance(previous, str) and isinstance(value, str):
+        a, b = _NUMBERED.match(previous), _NUMBERED.match(value)
+        if a and b and a.group(1) == b.group(1):
+            return ("text", a.group(1), int(b.group(2)) - int(a.group(2)))
+    return None
+
+
+def summarize_headers(labels, headers):
+    """
+    Collapse a header list into runs: repeated values become one entry and sequences (1, 2, 3 / 'Cluster 27', 'Cluster 28', ...)
+    become first .. last, with the step shown when it isn't 1. Runs shorter than MIN_RUN are listed one by one.
+
+    Args:
+        labels (list): what each header is called in the prompt, e.g. ["row_27", "row_28", ...]
+
+        headers (list): the header values, same length
+
+    Returns:
+        segments (list): one string per run, e.g. ["row_27..row_61: 'Cluster 27' .. 'Cluster 61'", "row_62: 'Total'"]
+    """
+    segments = []
+    start = 0
+    while start < len(headers):
+        end = start
+        pattern = _step(headers[start], headers[start + 1]) if start + 1 < len(headers) else None
+        if pattern is not None:
+            while end + 1 < len(headers) and _step(headers[end], headers[end + 1]) == pattern:
+                end += 1
+
+        if end - start + 1 < MIN_RUN:
+            segments.append(f"{labels[start]}: {headers[start]!r}")
+            start += 1 #the next header may still start a run of its own
+            continue
+        if pattern == ("same",):
+            segments.append(f"{labels[start]}..{labels[end]}: {headers[start]!r} (all {end - start + 1})")
+        else:
+            step = pattern[-1]
+            step_note = "" if step == 1 else f" (step {step})"
+            segments.append(f"{labels[start]}..{labels[end]}: {headers[start]!r} .. {headers[end]!r}{step_note}")
+        start = end + 1
+    return segments
+
+
+def _fit_segments(segments, max_tokens):
+    """
+    Keep the start and end of the segment list and drop the middle until it fits in max_tokens.
+    """
+    text = "; ".join(segments)
+    if estimate_tokens(text) <= max_tokens or len(segments) <= 2:
+        return text
+    head, tail = segments[: len(segments) // 2], segments[len(segments) // 2:]
+    while head or tail:
+        if len(head) >= len(tail):
+            head = head[:-1]
+        else:
+            tail = tail[1:]
+        dropped = len(segments) - len(head) - len(tail)
+        text = "; ".join(head + [f"... ({dropped} more)"] + tail)
+        if estimate_tokens(text) <= max_tokens:
+            break
+    return text
+
+
+def range_to_context(range_str, range_ws, formula_ws, cell_lookup, compact=False, max_tokens=DEFAULT_RANGE_TOKENS):
     """
     From range, give the context of what this range means
 
@@ -106,7 +191,11 @@ def range_to_context(range_str, range_ws, formula_ws, cell_lookup):
         
         formula_ws (str): title of the worksheet that the formula we are writing context for is in (for replacing)
 
-        cell_lookup: dict of dicts where first dict is of worksheets, then you have your dict of cells. Access via cell_lookupo['worksheet']['B4'] and then you can find row_descrip col_descrip or title if you want. See test.json for example.
+        cell_lookup: dict of dicts where first dict is of worksheets, then you have your dict of cells. Access via cell_lookupo['worksheet']['B4'] and then you can find row_descrip col_descrip or title if you want. SheetIndex.to_json() shows what is stored per table.
+
+        compact (bool): summarize the headers instead of listing every row_N / col_X (repeats and sequences collapsed, capped at max_tokens). Cached per (sheet, range), tokens saved go into range_context_stats.
+
+        max_tokens (int): token budget for each of the row / col summaries when compact
 
     Returns:
         context (str): a string that explains for an LLM what the context of the ranges is
@@ -131,10 +220,25 @@ def range_to_context(range_str, range_ws, formula_ws, cell_lookup):
     if range_ws not in cell_lookup:
         print(f"range_ws '{range_ws}' not in cell_lookup.")
         return ""
+
+    cache_key = (id(cell_lookup[range_ws]), range_ws, prefix, range_str, max_tokens) #prefix: the same range reads differently from its own sheet and from another one
+    if compact and cache_key in _range_summary_cache:
+        range_context_stats["cache_hits"] += 1
+        return _range_summary_cache[cache_key][1]
     
     try:
         min_col, min_row, max_col, max_row = range_boundaries(range_str)
 
+        if min_row is None or min_col is None: #whole column (A:C) or whole row (3:5), clamp it to the part of the sheet that's mapped
+            sheet_bounds = cell_lookup[range_ws].bounds() if hasattr(cell_lookup[range_ws], "bounds") else None
+            if sheet_bounds is None:
+                print(f"RANGE_CONTEXT: can't clamp open range {range_str}, '{range_ws}' has no mapped tables.")
+                return ""
+            if min_row is None:
+                min_row, max_row = sheet_bounds[1], sheet_bounds[3]
+            if min_col is None:
+                min_col, max_col = sheet_bounds[0], sheet_bounds[2]
+
         row_descrips = {}
         for row in range(min_row, max_row + 1):
             key = f"row_{row}"
@@ -155,9 +259,23 @@ def range_to_context(range_str, range_ws, formula_ws, cell_lookup):
         
         context = f"<{prefix}{range_str}>*{range_str}* is defined by the following row and column descriptions: {str(row_descrips)} {str(col_descrips)} in the broader table '{range_title}'</{prefix}{range_str}>"
 
+        if compact:
+            full_tokens = estimate_tokens(context)
+            rows_summary = _fit_segments(summarize_headers(list(row_descrips), list(row_descrips.values())), max_tokens)
+            cols_summary = _fit_segments(summarize_headers(list(col_descrips), list(col_descrips.values())), max_tokens)
+            context = f"<{prefix}{range_str}>*{range_str}* is defined by the following row and column descriptions: ROWS {rows_summary} COLS {cols_summary} in the broader table '{range_title}'</{prefix}{range_str}>"
+
+            compact_tokens = estimate_tokens(context)
+            range_context_stats["summaries"] += 1
+            range_context_stats["full_tokens"] += full_tokens
+            range_context_stats["compact_tokens"] += compact_tokens
+            range_context_stats["tokens_saved"] += full_tokens - compact_tokens
+            _range_summary_cache[cache_key] = (cell_lookup[range_ws], context)
+
         return context
     
     except KeyError as e:
+        instrument.count("range_lookup_errors")
         print(f"RANGE_CONTEXT: KeyError encountered. Missing key: {e}")
         # print("Traceback:")
         # traceback.print_exc()
@@ -169,7 +287,7 @@ def range_to_context(range_str, range_ws, formula_ws, cell_lookup):
         return ""
 
 
-def formula_context(formula, formula_ws, cell_lookup,values_wb):
+def formula_context(formula, formula_ws, cell_lookup,values_wb, compact=False, max_range_tokens=DEFAULT_RANGE_TOKENS):
     """
     Takes a formula and outputs a description of the context of the cells and ranges in the formula for an LLM to read
     
@@ -180,26 +298,31 @@ def formula_context(formula, formula_ws, cell_lookup,values_wb):
         
         cell_lookup (dict): your workbook-level dictionary that has keys for each of the sheets, then the values of the sheets are a dict of cells with the context for each cell
 
-        values_wb (dict)
+        values_wb: anything that answers values_wb[ws][cell].value for value fallbacks, e.g. value_index.ValueProvider (small memory footprint) or the workbook from the shared WorkbookSession (workbook_session.py). Don't load another copy just for this.
+
+        compact (bool), max_range_tokens (int): passed to range_to_context, summarizes big ranges instead of listing every row/col
         
     Returns:
         full_context (str): context of range explanations and cell explanations"""
-    cell_explanations = []
-    cell_refs = extract_cells(formula)  # this is going to return tuples ("ws", "B4")
-    for cell_ws, cell in cell_refs:
-        cell_context = cell_to_context(cell, cell_ws, formula_ws, cell_lookup, values_wb=values_wb)
-        if cell_context:
-            cell_explanations.append(cell_context)
-
-    range_explanations = []
-    ranges = extract_ranges(formula)  # also returns tuples
-    for range_ws, r in ranges:
-        range_context = range_to_context(range_str=r, range_ws=range_ws, formula_ws=formula_ws, cell_lookup=cell_lookup)
-        if range_context:
-            range_explanations.append(range_context)
-    
-    full_context = "\n".join(range_explanations + cell_explanations)
-    return full_context.strip()
+    with instrument.stage("formula_context"):
+        with instrument.stage("extract_refs"):
+            cell_refs = extract_cells(formula)  # this is going to return tuples ("ws", "B4")
+            ranges = extract_ranges(formula)  # also returns tuples
+
+        cell_explanations = []
+        for cell_ws, cell in cell_refs:
+            cell_context = cell_to_context(cell, cell_ws, formula_ws, cell_lookup, values_wb=values_wb)
+            if cell_context:
+                cell_explanations.append(cell_context)
+
+        range_explanations = []
+        for range_ws, r in ranges:
+            range_context = range_to_context(range_str=r, range_ws=range_ws, formula_ws=formula_ws, cell_lookup=cell_lookup, compact=compact, max_tokens=max_range_tokens)
+            if range_context:
+                range_explanations.append(range_context)
+        
+        full_context = "\n".join(range_explanations + cell_explanations)
+        return full_context.strip()
 
 # # Test cases
 # cell_lookup = {
@@ -1,56 +1,183 @@
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.utils import get_column_letter, range_boundaries, column_index_from_string
+from collections.abc import Mapping
 import json
+import re
+import sys
+import instrument
+from workbook_session import default_session
 
+COORD_PATTERN = re.compile(r"^([A-Z]{1,3})(\d+)$")
+ROW_BAND = 256 #rows per bucket in SheetIndex's row index
 
-def semantic_map_table(config, modify_dict): #look I don't love that we're using mutation, but we need some way to deal with overwriting so I prefer this than some kind of dictionary combining utility function
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class TableRegion:
+    """
+    One table from workbook_map.json, stored once: the check_cell_range bounds plus the header arrays.
+
+    col_headers[i] describes column col_header_start + i, row_headers[i] describes row row_header_start + i (same as reading
+    them off the col_descriptors / row_descriptors ranges).
+    """
+    __slots__ = ("title", "min_col", "min_row", "max_col", "max_row", "col_header_start", "col_headers", "row_header_start", "row_headers")
+
+    def __init__(self, title, check_bounds, col_header_start, col_headers, row_header_start, row_headers):
+        self.title = _intern(title)
+        self.min_col, self.min_row, self.max_col, self.max_row = check_bounds
+        self.col_header_start = col_header_start
+        self.col_headers = tuple(_intern(h) for h in col_headers)
+        self.row_header_start = row_header_start
+        self.row_headers = tuple(_intern(h) for h in row_headers)
+
+    def describe(self, col, row):
+        """
+        Returns:
+            {"col_descrip", "row_descrip", "title"} for (col, row), or None if the cell isn't in this table (or has no header)
+        """
+        if not (self.min_col <= col <= self.max_col and self.min_row <= row <= self.max_row):
+            return None
+        col_i = col - self.col_header_start
+        row_i = row - self.row_header_start
+        if not (0 <= col_i < len(self.col_headers) and 0 <= row_i < len(self.row_headers)):
+            return None
+        return {"col_descrip": self.col_headers[col_i], "row_descrip": self.row_headers[row_i], "title": self.title}
+
+    def cells(self):
+        for row in range(self.min_row, self.max_row + 1):
+            for col in range(self.min_col, self.max_col + 1):
+                if self.describe(col, row) is not None:
+                    yield col, row
+
+    def to_json(self):
+        return {
+            "title": self.title,
+            "check_cell_range": f"{get_column_letter(self.min_col)}{self.min_row}:{get_column_letter(self.max_col)}{self.max_row}",
+            "col_headers": {get_column_letter(self.col_header_start + i): h for i, h in enumerate(self.col_headers)},
+            "row_headers": {self.row_header_start + i: h for i, h in enumerate(self.row_headers)},
+        }
+
+
+class SheetIndex(Mapping):
+    """
+    Semantic map for one worksheet, stored per table instead of per cell.
+
+    Reads exactly like the old {cell: {...}} dict: sheet_index["B4"]["row_descrip"], "B4" in sheet_index, KeyError when the
+    cell isn't mapped. A lookup finds the table rectangle containing the cell (later tables win where they overlap, same as the
+    old dict overwrite) and indexes into its header arrays.
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.tables = []
+        self._bands = {} #{row // ROW_BAND: [table positions]}, so a lookup only looks at tables that overlap the cell's rows
+
+    def add_table(self, table):
+        position = len(self.tables)
+        self.tables.append(table)
+        for band in range(table.min_row // ROW_BAND, table.max_row // ROW_BAND + 1):
+            self._bands.setdefault(band, []).append(position)
+
+    def __getitem__(self, cell):
+        match = COORD_PATTERN.match(cell) if isinstance(cell, str) else None
+        if not match:
+            raise KeyError(cell)
+        col = column_index_from_string(match.group(1))
+        row = int(match.group(2))
+        for position in reversed(self._bands.get(row // ROW_BAND, ())):
+            cell_data = self.tables[position].describe(col, row)
+            if cell_data is not None:
+                return cell_data
+        raise KeyError(cell)
+
+    def __iter__(self):
+        seen = set()
+        for table in self.tables:
+            for col, row in table.cells():
+                if (col, row) not in seen:
+                    seen.add((col, row))
+                    yield f"{get_column_letter(col)}{row}"
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def bounds(self):
+        """
+        Returns:
+            (min_col, min_row, max_col, max_row) covering every table on the sheet, or None if there are no tables
+        """
+        if not self.tables:
+            return None
+        return (min(t.min_col for t in self.tables), min(t.min_row for t in self.tables),
+                max(t.max_col for t in self.tables), max(t.max_row for t in self.tables))
+
+    def to_json(self):
+        return [table.to_json() for table in self.tables]
+
+    def __getstate__(self):
+        return {"title": self.title, "tables": self.tables}
+
+    def __setstate__(self, state):
+        self.title = state["title"]
+        self.tables = []
+        self._bands = {}
+        for table in state["tables"]:
+            self.add_table(table)
+
+
+def semantic_map_table(config, sheet_index, session=default_session): #look I don't love that we're using mutation, but tables on a sheet can overlap and later ones need to win, so each table gets added onto the sheet's index in order
     workbook = config['workbook']
     worksheet = config['worksheet']
     col_descriptors = config['col_descriptors']
     row_descriptors = config['row_descriptors']
     check_cell_range = config['check_cell_range']
     table_title = config['table_title']
-    
-    value_wb = load_workbook(workbook, data_only=True)
-    ws = value_wb[worksheet]
+
+    ws = session.get_worksheet(workbook, worksheet, data_only=True) #parsed once per workbook, not once per table
 
     col_start_col, col_start_row, col_end_col, col_end_row = range_boundaries(col_descriptors)
     row_start_col, row_start_row, row_end_col, row_end_row = range_boundaries(row_descriptors)
 
     cells_start_col, cells_start_row, cells_end_col, cells_end_row = range_boundaries(check_cell_range)
 
-    col_headers = {} #this should be {1: "decription", 2: "description"}
-    row_headers = {} #this is also {1: "decription", 2: "description"}
-
     try:
-        for col in range(col_start_col, col_end_col+1):
-            col_headers[col] = ws.cell(row=col_start_row, column=col).value or "NULL"
-        
-        for row in range(row_start_row, row_end_row+1):
-            row_headers[row] = ws.cell(row=row, column=row_start_col).value or "NULL"
-        
-        for row in range(cells_start_row,cells_end_row+1):
-            for col in range(cells_start_col, cells_end_col+1):
-                modify_dict[f"{get_column_letter(col)}{row}"] = {"col_descrip":col_headers[col], "row_descrip":row_headers[row],"title":table_title}
+        col_headers = [ws.cell(row=col_start_row, column=col).value or "NULL" for col in range(col_start_col, col_end_col+1)]
+        row_headers = [ws.cell(row=row, column=row_start_col).value or "NULL" for row in range(row_start_row, row_end_row+1)]
+
+        if cells_start_col < col_start_col or cells_end_col > col_end_col or cells_start_row < row_start_row or cells_end_row > row_end_row:
+            print(f"An error occurred: check_cell_range {check_cell_range} goes outside the descriptors, cells without a header won't be mapped")
+            print("Here is the configuration that caused the error:", config)
+
+        sheet_index.add_table(TableRegion(
+            table_title,
+            (cells_start_col, cells_start_row, cells_end_col, cells_end_row),
+            col_start_col, col_headers,
+            row_start_row, row_headers,
+        ))
+        instrument.count("tables_mapped")
+        instrument.count("cells_mapped", (cells_end_col - cells_start_col + 1) * (cells_end_row - cells_start_row + 1))
     except Exception as e:
+        instrument.count("mapping_errors")
         print(f"An error occurred: {str(e)}")
         print("Here is the configuration that caused the error:", config)
 
-def semantic_map_workbook(workbook_map):
+def semantic_map_workbook(workbook_map, session=default_session):
     workbook_tree = {}
     for worksheet in workbook_map["worksheets"]:
-        worksheet_tree = {}
-        for table in worksheet["tables"]:
-            table_dic = {
-                "workbook": workbook_map["wb_title"],
-                "worksheet": worksheet["ws_title"],
-                "table_title": table["title"],
-                "col_descriptors": table["col_descriptors"],
-                "row_descriptors": table["row_descriptors"],
-                "check_cell_range": table["check_cell_range"]
-            }
-            semantic_map_table(table_dic, worksheet_tree)
-        workbook_tree[worksheet["ws_title"]] = worksheet_tree
+        with instrument.stage("semantic_map_sheet"): #includes parsing the sheet the first time the session sees it
+            worksheet_tree = SheetIndex(worksheet["ws_title"])
+            for table in worksheet["tables"]:
+                table_dic = {
+                    "workbook": workbook_map["wb_title"],
+                    "worksheet": worksheet["ws_title"],
+                    "table_title": table["title"],
+                    "col_descriptors": table["col_descriptors"],
+                    "row_descriptors": table["row_descriptors"],
+                    "check_cell_range": table["check_cell_range"]
+                }
+                semantic_map_table(table_dic, worksheet_tree, session=session)
+            workbook_tree[worksheet["ws_title"]] = worksheet_tree
     return workbook_tree
 
-        #ok so in theory, at this point we've gone through every worksheet and for each worksheet gone through every table and for each table constructed a dict and for each dict we added all of the cells to the semantic_map_table
\ No newline at end of file
+        #ok so in theory, at this point we've gone through every worksheet and for each worksheet gone through every table and for each table added its bounds + headers to that sheet's SheetIndex
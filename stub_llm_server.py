@@ -0,0 +1,81 @@
+import argparse
+import json
+import random
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Minimal OpenAI-compatible chat completions server for exercising the audit engine offline.
+#
+#   python stub_llm_server.py --port 8765 --latency 0.2 --error-rate 0.1
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python main.py
+#
+# First turn of a check gets a canned guess, the evaluation turn gets "[Y]" (or "[N]" for --no-rate of them).
+# --error-rate answers that fraction of requests with a 429 so retries/backoff get exercised.
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    no_rate = 0.0
+    requests_served = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": "not found"}})
+
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            return self._send(429, {"error": {"message": "stub rate limit", "type": "rate_limit_error"}})
+
+        messages = body.get("messages", [])
+        if len(messages) <= 1:
+            content = "I would expect a lookup of the row header against the column header in the source table."
+        else:
+            content = "[N] The references don't line up." if random.random() < self.no_rate else "[Y] Matches what I expected."
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        type(self).requests_served += 1
+        self._send(200, {
+            "id": f"stub-{self.requests_served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8765, latency=0.0, error_rate=0.0, no_rate=0.0):
+    """
+    Returns:
+        server (ThreadingHTTPServer): call serve_forever() (or run it in a thread) and shutdown() when done. port=0 picks a free port.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "error_rate": error_rate, "no_rate": no_rate})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stub OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to sleep per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--no-rate", type=float, default=0.0, help="fraction of evaluations answered [N]")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.error_rate, args.no_rate)
+    print(f"stub LLM server on http://{args.host}:{server.server_address[1]}/v1")
+    server.serve_forever()
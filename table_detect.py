@@ -0,0 +1,219 @@
+import argparse
+import json
+import re
+import numpy as np
+from openpyxl.utils import column_index_from_string, get_column_letter
+from xlsx_stream import StreamedWorkbook
+
+# Finds the tables on each sheet and writes a workbook_map.json that semantic_map.semantic_map_workbook can consume, so the
+# col_descriptors / row_descriptors / check_cell_range entries don't have to be written by hand.
+#
+# Each sheet's used range becomes a small int grid of cell types (one regex pass over the sheet XML). Everything after that
+# is numpy over the grid: empty rows/columns split the sheet into blocks (recursive XY-cut), then each block's header row and
+# descriptor column are picked from the share of text cells in each row/column.
+#
+#   python table_detect.py kc_big.xlsm -o workbook_map.json
+
+EMPTY, TEXT, NUMBER, FORMULA = 0, 1, 2, 3
+MAX_GRID_CELLS = 200_000_000 #a stray cell at XFD1048576 shouldn't make us allocate the whole sheet
+
+_CELL_TAG = re.compile(rb'<(?:\w+:)?c\s(?=[^>]*?\br="([A-Z]+)([0-9]+)")(?:[^>]*?\bt="(\w+)")?[^>]*?(/?)>(<(?:\w+:)?f\b)?')
+_TEXT_TYPES = {b"s", b"str", b"inlineStr"}
+
+
+def sheet_type_grid(xml, title=""):
+    """
+    Cell-type grid straight from a sheet's XML. One regex pass over the raw bytes, no per-cell objects, which is what keeps
+    1M+ cell sheets down to a few seconds.
+
+    Args:
+        xml (bytes): StreamedWorkbook.sheet_xml(title)
+
+    Returns:
+        (grid, min_row, min_col): int8 array of EMPTY/TEXT/NUMBER/FORMULA over the used range, plus the 1-based row/col of grid[0, 0].
+        grid is None for an empty sheet.
+    """
+    matches = _CELL_TAG.findall(xml)
+    if not matches:
+        return None, 1, 1
+    letters, digits, data_types, self_closing, formulas = zip(*matches)
+
+    col_cache = {}
+    for col_letters in set(letters):
+        col_cache[col_letters] = column_index_from_string(col_letters.decode())
+    cols = np.fromiter((col_cache[l] for l in letters), dtype=np.int32, count=len(letters))
+    rows = np.array(digits).astype(np.int32)
+
+    types = np.full(len(matches), NUMBER, dtype=np.int8)
+    types[np.fromiter((t in _TEXT_TYPES for t in data_types), dtype=bool, count=len(matches))] = TEXT
+    types[np.array(self_closing) == b"/"] = EMPTY #styled but empty
+    types[np.array(formulas) != b""] = FORMULA
+
+    min_row, min_col = int(rows.min()), int(cols.min())
+    height, width = int(rows.max()) - min_row + 1, int(cols.max()) - min_col + 1
+    if height * width > MAX_GRID_CELLS:
+        raise ValueError(f"'{title}' used range is {height}x{width}, too big to grid")
+    grid = np.zeros((height, width), dtype=np.int8)
+    grid[rows - min_row, cols - min_col] = types
+    return grid, min_row, min_col
+
+
+def _runs(mask, gap):
+    """
+    [start, end) index pairs of True runs in mask, where runs separated by fewer than gap False values are merged.
+    """
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    if len(starts) == 0:
+        return []
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= gap))
+    merged_starts = starts[keep]
+    merged_ends = np.concatenate((ends[:-1][keep[1:]], [ends[-1]]))
+    return list(zip(merged_starts.tolist(), merged_ends.tolist()))
+
+
+def find_blocks(grid, gap=1):
+    """
+    Recursive XY-cut: split on fully empty rows, then on fully empty columns inside each band, until no block splits further.
+
+    Returns:
+        blocks (list): (top, left, bottom, right) half-open grid indexes, in reading order
+    """
+    occupied = grid != EMPTY
+    blocks = []
+    stack = [(0, 0, grid.shape[0], grid.shape[1])]
+    while stack:
+        top, left, bottom, right = stack.pop()
+        sub = occupied[top:bottom, left:right]
+        row_runs = _runs(sub.any(axis=1), gap)
+        if len(row_runs) == 1:
+            col_runs = _runs(sub[row_runs[0][0]:row_runs[0][1]].any(axis=0), gap)
+            if len(col_runs) == 1:
+                (r0, r1), (c0, c1) = row_runs[0], col_runs[0]
+                blocks.append((top + r0, left + c0, top + r1, left + c1))
+                continue
+            stack.extend((top + row_runs[0][0], left + c0, top + row_runs[0][1], left + c1) for c0, c1 in reversed(col_runs))
+        else:
+            stack.extend((top + r0, left, top + r1, right) for r0, r1 in reversed(row_runs))
+    return sorted(blocks)
+
+
+def _is_period_header(row_types, row, left, values_at):
+    """
+    True if the numbers in a header row are whole and strictly increasing left to right (2021, 2022, ... / 1, 2, ... / date
+    serials), i.e. period headers above a numeric body rather than the body's first data row.
+    """
+    numeric = np.flatnonzero((row_types == NUMBER) | (row_types == FORMULA))
+    if len(numeric) < 2:
+        return False
+    values = [values_at(row, left + int(c)) for c in numeric]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and float(v).is_integer() for v in values):
+        return False
+    return all(a < b for a, b in zip(values, values[1:]))
+
+
+def _table_from_block(grid, block, min_row, min_col, values_at, min_data_cells):
+    """
+    Pick the title / header row / descriptor column for one block.
+
+    Returns:
+        table (dict) in workbook_map.json form, or None if the block doesn't look like a table
+    """
+    top, left, bottom, right = block
+    sub = grid[top:bottom, left:right]
+    if sub.shape[0] < 2 or sub.shape[1] < 2:
+        return None
+
+    non_empty = (sub != EMPTY).sum(axis=1)
+    text = (sub == TEXT).sum(axis=1)
+
+    title = None
+    header = 0
+    if non_empty[0] == 1 and text[0] == 1 and sub.shape[0] > 2: #a lone text cell on top is the table's title
+        title = values_at(top, left + int(np.flatnonzero(sub[0])[0]))
+        header = 1
+    if text[header] * 2 < non_empty[header] and not _is_period_header(sub[header], top + header, left, values_at):
+        return None #header row should be mostly text, or a run of years / periods / dates
+
+    body = sub[header + 1:]
+    if body.shape[0] == 0:
+        return None
+    col_text = (body == TEXT).sum(axis=0)
+    col_non_empty = (body != EMPTY).sum(axis=0)
+    text_cols = np.flatnonzero((col_non_empty > 0) & (col_text * 2 >= col_non_empty))
+    descriptor = int(text_cols[0]) if len(text_cols) else 0
+
+    data = body[:, descriptor + 1:]
+    if data.size == 0 or int(((data == NUMBER) | (data == FORMULA)).sum()) < min_data_cells:
+        return None
+
+    def a1(r, c):
+        return f"{get_column_letter(min_col + left + c)}{min_row + top + r}"
+
+    last_row, last_col = sub.shape[0] - 1, sub.shape[1] - 1
+    return {
+        "title": str(title) if title else f"Table at {a1(header, descriptor)}",
+        "col_descriptors": f"{a1(header, descriptor)}:{a1(header, last_col)}",
+        "row_descriptors": f"{a1(header + 1, descriptor)}:{a1(last_row, descriptor)}",
+        "check_cell_range": f"{a1(header + 1, descriptor + 1)}:{a1(last_row, last_col)}",
+    }
+
+
+def detect_tables(workbook, ws_title, gap=1, min_data_cells=2):
+    """
+    Args:
+        workbook (StreamedWorkbook)
+
+        ws_title (str): sheet to look at
+
+        gap (int): how many empty rows/cols it takes to separate two tables
+
+        min_data_cells (int): blocks with fewer number/formula cells than this are skipped (labels, notes, ...)
+
+    Returns:
+        tables (list): workbook_map.json-style table dicts
+    """
+    xml = workbook.sheet_xml(ws_title)
+    grid, min_row, min_col = sheet_type_grid(xml, ws_title)
+    if grid is None:
+        return []
+
+    def values_at(r, c):
+        coord = f"{get_column_letter(min_col + c)}{min_row + r}"
+        return workbook.peek_cells(ws_title, [coord], xml=xml)[coord]
+
+    tables = []
+    for block in find_blocks(grid, gap=gap):
+        table = _table_from_block(grid, block, min_row, min_col, values_at, min_data_cells)
+        if table:
+            tables.append(table)
+    return tables
+
+
+def build_workbook_map(path, gap=1, min_data_cells=2):
+    """
+    Returns:
+        workbook_map (dict): same shape as workbook_map.json, one entry per sheet that has at least one table
+    """
+    workbook = StreamedWorkbook(path)
+    worksheets = []
+    for ws_title in workbook.sheetnames: #one sheet's XML in memory at a time
+        tables = detect_tables(workbook, ws_title, gap=gap, min_data_cells=min_data_cells)
+        if tables:
+            worksheets.append({"ws_title": ws_title, "tables": tables})
+    return {"wb_title": path, "worksheets": worksheets}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="detect tables and write a workbook_map.json")
+    parser.add_argument("workbook")
+    parser.add_argument("-o", "--output", default="workbook_map.json")
+    parser.add_argument("--gap", type=int, default=1, help="empty rows/cols between tables")
+    parser.add_argument("--min-data-cells", type=int, default=2)
+    args = parser.parse_args()
+
+    workbook_map = build_workbook_map(args.workbook, gap=args.gap, min_data_cells=args.min_data_cells)
+    with open(args.output, "w") as f:
+        json.dump(workbook_map, f, indent=2)
+    print(f"Found {sum(len(ws['tables']) for ws in workbook_map['worksheets'])} tables on {len(workbook_map['worksheets'])} sheets, saved to {args.output}")
@@ -0,0 +1,64 @@
+import datetime
+from openpyxl import Workbook
+import table_detect
+
+
+def _save(tmp_path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Model"
+    for row in rows:
+        sheet.append(row)
+    path = str(tmp_path / "model.xlsx")
+    workbook.save(path)
+    return path
+
+
+def test_text_header(tmp_path):
+    path = _save(tmp_path, [
+        ["Line", "Q1", "Q2", "Q3"],
+        ["Revenue", 100, 110, 120],
+        ["Costs", 60, 65, 70],
+    ])
+    assert table_detect.build_workbook_map(path)["worksheets"] == [{"ws_title": "Model", "tables": [{
+        "title": "Table at A1",
+        "col_descriptors": "A1:D1",
+        "row_descriptors": "A2:A3",
+        "check_cell_range": "B2:D3",
+    }]}]
+
+
+def test_year_header_under_title(tmp_path):
+    path = _save(tmp_path, [
+        ["Income statement"],
+        ["Line", 2021, 2022, 2023, 2024],
+        ["Revenue", 100, 110, 121, 133],
+        ["Costs", 60, 66, 73, 80],
+        ["Profit", 40, 44, 48, 53],
+    ])
+    assert table_detect.build_workbook_map(path)["worksheets"] == [{"ws_title": "Model", "tables": [{
+        "title": "Income statement",
+        "col_descriptors": "A2:E2",
+        "row_descriptors": "A3:A5",
+        "check_cell_range": "B3:E5",
+    }]}]
+
+
+def test_date_header(tmp_path):
+    months = [datetime.datetime(2024, month, 1) for month in (1, 2, 3)]
+    path = _save(tmp_path, [
+        ["Line", *months],
+        ["Revenue", 100, 110, 121],
+        ["Costs", 60, 66, 73],
+    ])
+    tables = table_detect.build_workbook_map(path)["worksheets"][0]["tables"]
+    assert [table["col_descriptors"] for table in tables] == ["A1:D1"]
+
+
+def test_numeric_first_row_is_not_a_header(tmp_path):
+    path = _save(tmp_path, [
+        ["Income statement"],
+        ["Revenue", 100, 90, 121],
+        ["Costs", 60, 66, 73],
+    ])
+    assert table_detect.build_workbook_map(path)["worksheets"] == []
@@ -0,0 +1,135 @@
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+import map_cache
+from xlsx_stream import StreamedWorkbook, StreamedCell, EMPTY_CELL
+
+# Lazy stand-in for the data_only workbook that parse.cell_to_context falls back to (values_wb[ws][cell].value). Nothing is
+# held in memory except a small LRU of recently read cells. The first time a sheet is asked for, it's streamed once into an
+# on-disk SQLite index next to the other caches (keyed by the workbook bytes, so an edited workbook gets a new index), and
+# every read after that, including in later runs, is a single indexed lookup.
+
+DEFAULT_LRU_SIZE = 4096
+SQLITE_TIMEOUT = 300 #seconds to wait on another process (parallel.py workers) indexing a big sheet into the same file
+_NATIVE_TYPES = (int, float, str, type(None)) #stored as-is, anything else (bool, datetime, time) is pickled into a BLOB
+
+
+def index_path(workbook_path, cache_dir=map_cache.CACHE_DIR):
+    return os.path.join(cache_dir, f"values-{map_cache.workbook_digest(workbook_path)[:16]}.sqlite")
+
+
+def _encode(value):
+    return value if type(value) in _NATIVE_TYPES else pickle.dumps(value)
+
+
+def _decode(value):
+    return pickle.loads(value) if isinstance(value, bytes) else value
+
+
+class _SheetValues:
+    """
+    What provider[ws_title] hands back. Only supports [coord], which is all cell_to_context needs.
+    """
+
+    def __init__(self, provider, title):
+        self._provider = provider
+        self.title = title
+
+    def __getitem__(self, coord):
+        return self._provider.get(self.title, coord)
+
+
+class ValueProvider:
+    """
+    provider[ws_title][coord] -> StreamedCell(value, formula, data_type), EMPTY_CELL for a blank cell. An unknown sheet raises
+    KeyError, like a workbook would.
+
+    Args:
+        workbook_path (str): .xlsx/.xlsm
+
+        path (str): sqlite index file, defaults to index_path(workbook_path)
+
+        lru_size (int): cells kept in memory
+    """
+
+    def __init__(self, workbook_path, path=None, lru_size=DEFAULT_LRU_SIZE):
+        self.workbook_path = workbook_path
+        self.path = path or index_path(workbook_path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lru_size = lru_size
+        self.stats = {"hits": 0, "lookups": 0, "sheets_indexed": 0}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock() #one connection shared by every thread (context_server.py serves from several)
+        self._conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sheets (ws TEXT PRIMARY KEY, indexed INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cells (ws TEXT, coord TEXT, value, formula TEXT, data_type TEXT, PRIMARY KEY (ws, coord)) WITHOUT ROWID")
+        self._conn.commit()
+        self._sheets = dict(self._conn.execute("SELECT ws, indexed FROM sheets").fetchall())
+        self._workbook = None
+
+    def _streamed(self):
+        if self._workbook is None:
+            self._workbook = StreamedWorkbook(self.workbook_path, max_sheets=1)
+        return self._workbook
+
+    def _load_sheetnames(self):
+        names = self._streamed().sheetnames
+        self._conn.executemany("INSERT OR IGNORE INTO sheets (ws, indexed) VALUES (?, 0)", [(name,) for name in names])
+        self._conn.commit()
+        self._sheets = {name: self._sheets.get(name, 0) for name in names}
+
+    def _index_sheet(self, ws_title):
+        """
+        Stream one sheet into the index, in a single transaction. The parsed sheet is dropped straight afterwards.
+        """
+        sheet = next(self._streamed().iter_sheets([ws_title]))
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO cells (ws, coord, value, formula, data_type) VALUES (?, ?, ?, ?, ?)",
+                                   ((ws_title, coord, _encode(cell.value), cell.formula, cell.data_type) for coord, cell in sheet.items()))
+            self._conn.execute("UPDATE sheets SET indexed = 1 WHERE ws = ?", (ws_title,))
+        self._sheets[ws_title] = 1
+        self.stats["sheets_indexed"] += 1
+
+    @property
+    def sheetnames(self):
+        with self._lock:
+            if not self._sheets:
+                self._load_sheetnames()
+            return list(self._sheets)
+
+    def __contains__(self, ws_title):
+        return ws_title in self.sheetnames
+
+    def __getitem__(self, ws_title):
+        if ws_title not in self:
+            raise KeyError(ws_title)
+        return _SheetValues(self, ws_title)
+
+    def get(self, ws_title, coord):
+        key = (ws_title, coord)
+        with self._lock:
+            self.stats["lookups"] += 1
+            cell = self._lru.get(key)
+            if cell is not None:
+                self._lru.move_to_end(key)
+                self.stats["hits"] += 1
+                return cell
+
+            if not self._sheets.get(ws_title):
+                self._index_sheet(ws_title)
+            row = self._conn.execute("SELECT value, formula, data_type FROM cells WHERE ws = ? AND coord = ?", key).fetchone()
+            cell = StreamedCell(_decode(row[0]), row[1], row[2]) if row else EMPTY_CELL
+
+            self._lru[key] = cell
+            if len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+            return cell
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._lru.clear()
+            self._workbook = None
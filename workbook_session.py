@@ -0,0 +1,71 @@
+from openpyxl import load_workbook
+from xlsx_stream import StreamedWorkbook
+import instrument
+
+
+class WorkbookSession:
+    """
+    Keeps every workbook we touch parsed exactly once, so semantic_map, parse and main.py can all share the same openpyxl objects.
+
+    Usage:
+        session = WorkbookSession()
+        ws = session.get_worksheet('kc_big.xlsm', 'Master Coverage Ratios')  # parses kc_big.xlsm (values) the first time
+        ws = session.get_worksheet('kc_big.xlsm', 'S9-13, 29-36 | Ratio Summaries')  # reuses the parse
+
+    stats tracks how often we actually parsed vs reused, so we can confirm the reuse is happening.
+
+    Args:
+        streaming (bool): hand out xlsx_stream.StreamedWorkbook objects instead of openpyxl ones. One streamed workbook has both
+        formulas and cached values, so data_only=True/False share the same object and each sheet's XML is only walked once.
+
+        max_sheets (int): streaming only, how many parsed sheets each StreamedWorkbook keeps (least recently used are dropped and
+        re-parsed if asked for again). None keeps every sheet, which on a big model means the whole workbook ends up in memory.
+    """
+
+    def __init__(self, streaming=False, max_sheets=None):
+        self.streaming = streaming
+        self.max_sheets = max_sheets
+        self._workbooks = {}  # {(path, data_only): openpyxl Workbook}, or {(path, None): StreamedWorkbook} when streaming
+        self.stats = {"loads": 0, "workbook_hits": 0, "worksheet_requests": 0}
+
+    def get_workbook(self, path, data_only=True):
+        """
+        Return the openpyxl workbook for path, parsing it only the first time it's asked for.
+
+        Args:
+            path (str): path to the .xlsx/.xlsm file
+
+            data_only (bool): True for cached values, False for formulas. These are separate parses in openpyxl so they're cached separately.
+
+        Returns:
+            workbook: the shared openpyxl Workbook
+        """
+        key = (path, None if self.streaming else data_only)
+        if key in self._workbooks:
+            self.stats["workbook_hits"] += 1
+            return self._workbooks[key]
+
+        if self.streaming:
+            workbook = StreamedWorkbook(path, max_sheets=self.max_sheets)
+        else:
+            with instrument.stage("load_workbook"):
+                workbook = load_workbook(path, data_only=data_only)
+        self._workbooks[key] = workbook
+        self.stats["loads"] += 1
+        return workbook
+
+    def get_worksheet(self, path, ws_title, data_only=True):
+        """
+        Return a worksheet handle from the shared workbook. Raises KeyError if the sheet doesn't exist (same as openpyxl).
+        """
+        self.stats["worksheet_requests"] += 1
+        return self.get_workbook(path, data_only=data_only)[ws_title]
+
+    def close(self):
+        """
+        Drop every cached workbook (e.g. once the workbook file has changed on disk).
+        """
+        self._workbooks.clear()
+
+
+default_session = WorkbookSession() #shared by anything that doesn't pass its own session
@@ -0,0 +1,285 @@
+import zipfile
+import posixpath
+import re
+from html import unescape
+import xml.etree.ElementTree as ET
+from collections import namedtuple, OrderedDict
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import from_excel, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+from openpyxl.utils.cell import get_column_letter
+import instrument
+
+# Streaming reader for .xlsx/.xlsm. Walks each sheet's XML once and pulls out both the formula and the cached value for every
+# cell, so we don't need two full openpyxl loads (data_only=False + data_only=True) of the same file.
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+StreamedCell = namedtuple("StreamedCell", ["value", "formula", "data_type"]) #formula is "=..." (same as openpyxl data_only=False) or None
+EMPTY_CELL = StreamedCell(None, None, "n")
+
+_PEEK_VALUE = re.compile(rb"<(?:\w+:)?v>(.*?)</(?:\w+:)?v>|<(?:\w+:)?t(?:\s[^>]*)?>(.*?)</(?:\w+:)?t>", re.S)
+_PEEK_TYPE = re.compile(rb'\bt="(\w+)"')
+
+
+class StreamedSheet(dict):
+    """
+    {coord: StreamedCell} for one worksheet. Missing coords give EMPTY_CELL, same as openpyxl handing back an empty cell,
+    so values_wb[ws][cell].value keeps working.
+    """
+
+    def __init__(self, title):
+        super().__init__()
+        self.title = title
+
+    def __missing__(self, coord):
+        return EMPTY_CELL
+
+    def cell(self, row, column):
+        """
+        openpyxl-style ws.cell(row=, column=) so semantic_map can read headers off a streamed sheet.
+        """
+        return self[f"{get_column_letter(column)}{row}"]
+
+
+def _sheet_members(zf):
+    """
+    Returns:
+        [(sheet title, zip member path)] in workbook order. Chartsheets are skipped.
+    """
+    workbook_xml = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels_xml = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+
+    targets = {}
+    for rel in rels_xml.iter(f"{PKG_REL_NS}Relationship"):
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join("xl", target))
+        targets[rel.get("Id")] = target
+
+    members = []
+    for sheet in workbook_xml.iter(f"{NS}sheet"):
+        target = targets.get(sheet.get(f"{REL_NS}id"), "")
+        if "worksheets/" in target:
+            members.append((sheet.get("name"), target))
+    return members
+
+
+def _date_1904(zf):
+    workbook_xml = ET.fromstring(zf.read("xl/workbook.xml"))
+    pr = workbook_xml.find(f"{NS}workbookPr")
+    return pr is not None and pr.get("date1904") in ("1", "true")
+
+
+def _shared_strings(zf):
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    strings = []
+    for _, elem in ET.iterparse(zf.open("xl/sharedStrings.xml")):
+        if elem.tag == f"{NS}si":
+            strings.append("".join(t.text or "" for t in elem.iter(f"{NS}t")))
+            elem.clear()
+    return strings
+
+
+def _date_styles(zf):
+    """
+    Returns:
+        set of cellXfs indexes (the s="" attribute on a cell) whose number format is a date, so we can hand back datetimes like openpyxl does.
+    """
+    if "xl/styles.xml" not in zf.namelist():
+        return set()
+    styles_xml = ET.fromstring(zf.read("xl/styles.xml"))
+
+    formats = dict(BUILTIN_FORMATS)
+    num_fmts = styles_xml.find(f"{NS}numFmts")
+    if num_fmts is not None:
+        for fmt in num_fmts.iter(f"{NS}numFmt"):
+            formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode")
+
+    date_styles = set()
+    cell_xfs = styles_xml.find(f"{NS}cellXfs")
+    if cell_xfs is not None:
+        for i, xf in enumerate(cell_xfs.iter(f"{NS}xf")):
+            fmt = formats.get(int(xf.get("numFmtId", 0)))
+            if fmt and is_date_format(fmt):
+                date_styles.add(i)
+    return date_styles
+
+
+def _cast_value(raw, data_type, style, shared_strings, date_styles, epoch):
+    if data_type == "s":
+        return shared_strings[int(raw)]
+    if data_type in ("str", "e", "inlineStr"):
+        return raw
+    if data_type == "b":
+        return raw in ("1", "true")
+    if data_type == "d":
+        return raw
+    # plain number
+    if "." in raw or "E" in raw or "e" in raw:
+        value = float(raw)
+    else:
+        value = int(raw)
+    if style in date_styles:
+        try:
+            return from_excel(value, epoch=epoch)
+        except (ValueError, OverflowError):
+            return value
+    return value
+
+
+@instrument.timed("parse_sheet")
+def _read_sheet(zf, title, member, shared_strings, date_styles, epoch):
+    """
+    Single iterparse pass over one sheet's XML. Each <c> element is turned into a StreamedCell and cleared straight away,
+    so the only thing that grows is the resulting dict.
+    """
+    sheet = StreamedSheet(title)
+    shared_formulas = {}  # {si: (master formula, master coord)}
+
+    c_tag, f_tag, v_tag, is_tag, t_tag, row_tag = (f"{NS}c", f"{NS}f", f"{NS}v", f"{NS}is", f"{NS}t", f"{NS}row")
+
+    for _, elem in ET.iterparse(zf.open(member)):
+        if elem.tag == c_tag:
+            coord = elem.get("r")
+            data_type = elem.get("t", "n")
+            style = int(elem.get("s", 0))
+
+            formula = None
+            f_elem = elem.find(f_tag)
+            if f_elem is not None:
+                f_type = f_elem.get("t")
+                if f_type == "shared":
+                    si = f_elem.get("si")
+                    if f_elem.text: # the master cell of a filled range
+                        formula = f"={f_elem.text}"
+                        shared_formulas[si] = (formula, coord)
+                    elif si in shared_formulas:
+                        master_formula, master_coord = shared_formulas[si]
+                        formula = Translator(master_formula, origin=master_coord).translate_formula(coord)
+                elif f_type != "dataTable" and f_elem.text:
+                    formula = f"={f_elem.text}"
+
+            value = None
+            if data_type == "inlineStr":
+                is_elem = elem.find(is_tag)
+                if is_elem is not None:
+                    value = "".join(t.text or "" for t in is_elem.iter(t_tag))
+            else:
+                v_elem = elem.find(v_tag)
+                if v_elem is not None and v_elem.text is not None:
+                    value = _cast_value(v_elem.text, data_type, style, shared_strings, date_styles, epoch)
+
+            if value is not None or formula is not None:
+                sheet[coord] = StreamedCell(value, formula, "f" if formula else data_type)
+            elem.clear()
+        elif elem.tag == row_tag:
+            elem.clear()
+    instrument.count("cells_parsed", len(sheet))
+    return sheet
+
+
+class StreamedWorkbook:
+    """
+    Formulas + cached values for a workbook from one pass over each sheet's XML.
+
+    Sheets are parsed lazily the first time they're asked for. Indexing mirrors openpyxl closely enough for parse.py:
+        wb[ws_title][coord].value   -> cached value (what data_only=True gives)
+        wb[ws_title][coord].formula -> formula text (what data_only=False gives), None for constants
+
+    Args:
+        path (str): .xlsx or .xlsm
+
+        max_sheets (int): how many parsed sheets to keep around (least recently used get dropped). None keeps all of them.
+    """
+
+    def __init__(self, path, max_sheets=None):
+        self.path = path
+        self.max_sheets = max_sheets
+        self._sheets = OrderedDict()
+        self._members = None #sheet list, shared strings and styles are read the first time anything needs them
+        self.stats = {"sheets_parsed": 0, "sheet_hits": 0}
+
+    def _load_meta(self):
+        if self._members is not None:
+            return
+        with instrument.stage("load_workbook_meta"), zipfile.ZipFile(self.path) as zf: #sheet list + shared strings + styles
+            self._members = OrderedDict(_sheet_members(zf))
+            self._shared_strings = _shared_strings(zf)
+            self._date_styles = _date_styles(zf)
+            self._epoch = CALENDAR_MAC_1904 if _date_1904(zf) else CALENDAR_WINDOWS_1900
+
+    @property
+    def sheetnames(self):
+        self._load_meta()
+        return list(self._members)
+
+    def __contains__(self, ws_title):
+        self._load_meta()
+        return ws_title in self._members
+
+    def __getitem__(self, ws_title):
+        if ws_title in self._sheets:
+            self._sheets.move_to_end(ws_title)
+            self.stats["sheet_hits"] += 1
+            return self._sheets[ws_title]
+        self._load_meta()
+        if ws_title not in self._members:
+            raise KeyError(f"Worksheet {ws_title} does not exist.")
+
+        with zipfile.ZipFile(self.path) as zf:
+            sheet = _read_sheet(zf, ws_title, self._members[ws_title], self._shared_strings, self._date_styles, self._epoch)
+        self.stats["sheets_parsed"] += 1
+
+        self._sheets[ws_title] = sheet
+        if self.max_sheets is not None and len(self._sheets) > self.max_sheets:
+            self._sheets.popitem(last=False)
+        return sheet
+
+    def iter_sheets(self, titles=None):
+        """
+        Yield each StreamedSheet in turn without caching them, so a full pass over the workbook only ever holds one sheet.
+        """
+        self._load_meta()
+        with zipfile.ZipFile(self.path) as zf:
+            for title, member in self._members.items():
+                if titles is not None and title not in titles:
+                    continue
+                self.stats["sheets_parsed"] += 1
+                yield _read_sheet(zf, title, member, self._shared_strings, self._date_styles, self._epoch)
+
+    def sheet_xml(self, ws_title):
+        """
+        Raw XML bytes of one sheet, for callers that only need a fast regex scan (e.g. table_detect's cell-type grid).
+        """
+        self._load_meta()
+        with zipfile.ZipFile(self.path) as zf:
+            return zf.read(self._members[ws_title])
+
+    def peek_cells(self, ws_title, coords, xml=None):
+        """
+        Values of a handful of cells without parsing the whole sheet (no date conversion, it's meant for labels/titles).
+
+        Returns:
+            {coord: value} (None for cells that aren't there)
+        """
+        self._load_meta()
+        xml = xml if xml is not None else self.sheet_xml(ws_title)
+        values = {}
+        for coord in coords:
+            match = re.search(rb'<(?:\w+:)?c\s[^>]*?\br="' + coord.encode() + rb'"([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)', xml, re.S)
+            value = None
+            if match and match.group(2):
+                type_match = _PEEK_TYPE.search(match.group(0).split(b">", 1)[0])
+                data_type = type_match.group(1).decode() if type_match else "n"
+                found = _PEEK_VALUE.search(match.group(2))
+                if found:
+                    raw = unescape((found.group(1) if found.group(1) is not None else found.group(2)).decode())
+                    value = raw if data_type == "inlineStr" else _cast_value(raw, data_type, 0, self._shared_strings, set(), self._epoch)
+            values[coord] = value
+        return values